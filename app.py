@@ -1,19 +1,32 @@
 import streamlit as st
-import pandas as pd
 import time # Import time untuk delay sedikit agar toast terbaca
+import profiling
+profiling.begin() # hanya aktif dengan PROFILE=1 atau ?profile=1 (admin)
 
-# Import modul buatan sendiri
-import database as db
-import utils
+# Import modul buatan sendiri (database_async dimuat saat halaman kalkulator dibuka)
+with profiling.section("import"):
+    import config
+    import database as db
+    import metrics
+    import security
+    import utils
 
 # --- CONFIG & INIT ---
 st.set_page_config(page_title="Manajemen Resep App", layout="wide")
 
 # Init DB saat pertama kali load
 if 'db_initialized' not in st.session_state:
-    db.init_db()
+    with profiling.section("init_db"):
+        db.init_db()
     st.session_state['db_initialized'] = True
 
+# --- FUNGSI HELPER UI (TAB) ---
+def lazy_tabs(tabs, key):
+    """Pengganti st.tabs yang hanya menjalankan isi tab aktif. `tabs` berisi {label: fungsi}."""
+    label = st.radio("Tab", list(tabs), key=key, horizontal=True, label_visibility="collapsed")
+    with profiling.section(f"tab:{label}"):
+        tabs[label]()
+
 # --- FUNGSI HELPER UI (TOAST) ---
 def show_success_toast(message):
     st.toast(message, icon='✅')
@@ -23,6 +36,39 @@ def show_warning_toast(message):
     st.toast(message, icon='🗑️')
     time.sleep(0.8)
 
+# --- FUNGSI HELPER UI (PICKER BERHALAMAN) ---
+def paged_picker(label, fetch, key_col, label_col, key, show_table=False):
+    """Selectbox dengan kotak cari yang hanya memuat satu halaman data dari server per render.
+
+    `fetch(term, cursor)` mengembalikan (DataFrame, cursor berikutnya). Return (key terpilih, baris) atau None.
+    """
+    term = st.text_input(f"Cari {label}", key=f"{key}_q", placeholder="Ketik sebagian nama...")
+    pages = st.session_state.get(f"{key}_pages")
+    if pages is None or pages['term'] != term:
+        pages = st.session_state[f"{key}_pages"] = {'term': term, 'cursors': [None]}
+    
+    df, next_cursor = fetch(term, pages['cursors'][-1])
+    if (df is None or df.empty) and len(pages['cursors']) > 1:
+        # Halaman ini kosong (mis. baris terakhirnya baru dihapus): mundur satu halaman
+        pages['cursors'].pop()
+        st.rerun()
+    if df is None or df.empty:
+        st.caption("Tidak ada data yang cocok.")
+        return None
+    if show_table: st.dataframe(df, use_container_width=True, hide_index=True)
+    
+    opts = dict(zip(df[key_col], df[label_col]))
+    sel = st.selectbox(f"Pilih {label}", list(opts), format_func=lambda x: opts[x], key=f"{key}_sel")
+    c_prev, c_info, c_next = st.columns([1, 2, 1])
+    if len(pages['cursors']) > 1 and c_prev.button("◀ Sebelumnya", key=f"{key}_prev"):
+        pages['cursors'].pop()
+        st.rerun()
+    c_info.caption(f"Halaman {len(pages['cursors'])}")
+    if next_cursor is not None and c_next.button("Berikutnya ▶", key=f"{key}_next"):
+        pages['cursors'].append(next_cursor)
+        st.rerun()
+    return sel, df[df[key_col] == sel].iloc[0]
+
 # --- FUNGSI INISIALISASI SESI ---
 def init_session():
     if 'logged_in' not in st.session_state:
@@ -34,26 +80,26 @@ def init_session():
     if 'menu_list' not in st.session_state:
         st.session_state['menu_list'] = []
 
-    # Logika Auto-Login dari URL
-    if not st.session_state['logged_in'] and 'user' in st.query_params:
-        username_url = st.query_params['user']
-        try:
-            user_data = db.get_user_by_username(username_url)
-            if user_data:
-                st.session_state['logged_in'] = True
-                st.session_state['username'] = user_data[0]
-                st.session_state['role'] = user_data[2]
-            else:
-                st.query_params.clear()
-        except Exception:
-            pass
+    # Logika Auto-Login dari token sesi bertanda tangan di URL. Token hanya membuktikan identitas:
+    # user & role dibaca ulang (lookup PK, sekali per sesi baru) agar user yang sudah dihapus
+    # atau diturunkan rolenya tidak tetap masuk dengan token lama.
+    if not st.session_state['logged_in'] and 'token' in st.query_params:
+        session = security.verify_token(st.query_params['token'])
+        user = db.get_user_by_username(session[0]) if session else None
+        if user:
+            st.session_state['logged_in'] = True
+            st.session_state['username'], st.session_state['role'] = user[0], user[2]
+        else:
+            st.query_params.clear()
 
 # --- MAIN ROUTER ---
 def main():
     init_session()
     
     if not st.session_state['logged_in']:
-        page_login()
+        metrics.set_page("Login")
+        with profiling.section("page:Login"):
+            page_login()
     else:
         st.sidebar.title(f"👨‍🍳 Halo, {st.session_state['username']}")
         
@@ -61,6 +107,9 @@ def main():
             st.session_state['logged_in'] = False
             st.session_state['role'] = None
             st.session_state['menu_list'] = []
+            st.session_state['plan_id'] = None
+            st.session_state['menu_plan_loaded'] = None
+            if 'token' in st.query_params: security.revoke_token(st.query_params['token'])
             st.query_params.clear()
             st.rerun()
             
@@ -68,7 +117,7 @@ def main():
         
         if st.session_state['role'] == 'admin':
             st.sidebar.caption("Menu Administrator")
-            options = ["Kalkulator", "Resep", "User"]
+            options = ["Kalkulator", "Resep", "User", "Metrik"]
             default_index = 0
             if "page" in st.query_params:
                 current_page_param = st.query_params["page"]
@@ -80,14 +129,31 @@ def main():
             if st.query_params.get("page") != selected_menu:
                 st.query_params["page"] = selected_menu
             
-            if selected_menu == "Kalkulator": page_calculator()
-            elif selected_menu == "Resep": page_manage_recipes()
-            elif selected_menu == "User": page_manage_users()
+            with st.sidebar.expander("📊 Status Koneksi DB"):
+                ps = db.get_pool_stats()
+                st.caption(f"Dipakai: {ps['in_use']}/{ps['max_size']} ({ps['utilization']:.0%})")
+                st.caption(f"Rata-rata tunggu: {ps['avg_wait_ms']:.1f} ms (maks {ps['max_wait_ms']:.1f} ms)")
+                st.caption(f"Checkout: {ps['checkouts']} | Reconnect: {ps['reconnects']}")
+                cs = db.get_cache_stats()
+                st.caption(f"Cache: {cs['entries']}/{cs['max_entries']} entri, hit {cs['hit_rate']:.0%} (v{cs['version']})")
+                st.caption(f"Cache bersama: {cs['backend']} | hit: {cs['shared_hits']}")
+                rs = db.get_replica_stats()
+                if rs is not None:
+                    st.caption(f"Replika: {'aktif' if rs['up'] else '⚠️ dialihkan ke primary'} | "
+                               f"Baca: {rs['reads']} | Fallback: {rs['fallbacks']}")
+
+            metrics.set_page(selected_menu)
+            pages = {"Kalkulator": page_calculator, "Resep": page_manage_recipes,
+                     "User": page_manage_users, "Metrik": page_metrics}
+            with profiling.section(f"page:{selected_menu}"):
+                pages[selected_menu]()
             
         else:
             if st.query_params.get("page") != "Kalkulator":
                 st.query_params["page"] = "Kalkulator"
-            page_calculator()
+            metrics.set_page("Kalkulator")
+            with profiling.section("page:Kalkulator"):
+                page_calculator()
 
 # --- HALAMAN-HALAMAN (VIEWS) ---
 
@@ -107,244 +173,407 @@ def page_login():
                     st.session_state['logged_in'] = True
                     st.session_state['username'] = user[0]
                     st.session_state['role'] = user[2]
-                    st.query_params['user'] = user[0]
+                    st.query_params['token'] = security.issue_token(user[0], user[2])
                     show_success_toast(f"Selamat datang, {user[0]}!")
                     st.rerun()
                 else:
                     st.toast("Username atau Password salah!", icon='❌')
 
+def load_menu_plan():
+    """Rencana menu aktif milik user (dibuat jika belum ada); daftar masakannya dimuat sekali per rencana."""
+    if st.session_state.get('plan_id') is None:
+        plans = db.get_user_plans(st.session_state['username'])
+        if plans is None: return None
+        if plans.empty: st.session_state['plan_id'] = db.create_plan(st.session_state['username'], "Rencana Saya")
+        else: st.session_state['plan_id'] = int(plans['id'].iloc[0])
+    
+    plan_id = st.session_state['plan_id']
+    if plan_id is None: return None # rencana gagal dibuat, dicoba lagi di rerun berikutnya
+    if st.session_state.get('menu_plan_loaded') != plan_id:
+        items = db.get_plan_items(plan_id)
+        if items is None: return None
+        st.session_state.menu_list = items.to_dict('records')
+        st.session_state['menu_plan_loaded'] = plan_id
+    return plan_id
+
+def menu_plan_selector():
+    plans = db.get_user_plans(st.session_state['username'])
+    if plans is None or plans.empty: return
+    names = dict(zip(plans['id'], plans['name']))
+    ids = list(names)
+    cur = st.session_state['plan_id']
+    pick = st.selectbox("Rencana Menu", ids, index=ids.index(cur) if cur in ids else 0, format_func=lambda x: names[x])
+    if pick != cur:
+        st.session_state['plan_id'] = int(pick)
+        st.rerun()
+    with st.expander("➕ Rencana Baru"):
+        with st.form("new_plan"):
+            nm = st.text_input("Nama Rencana", placeholder="Misal: Arisan Sabtu")
+            if st.form_submit_button("Buat Rencana") and nm:
+                new_id = db.create_plan(st.session_state['username'], nm)
+                if new_id is not None:
+                    st.session_state['plan_id'] = new_id
+                    show_success_toast(f"Rencana '{nm}' dibuat!")
+                    st.rerun()
+
 def page_calculator():
     st.title("🍳 Aplikasi Masak Cerdas")
     st.caption("Kelola rencana masak Anda, hitung kebutuhan belanja, atau cari inspirasi dari stok di kulkas.")
     
-    tab1, tab2 = st.tabs(["🛒 Hitung Belanja", "🔍 Cari Resep dari Stok"])
+    lazy_tabs({"🛒 Hitung Belanja": tab_shopping_list, "🔍 Cari Resep dari Stok": tab_recipe_finder,
+               "💰 Bandingkan Biaya": tab_cost_compare}, key='calc_tab')
+
+# --- TAB 1: KALKULATOR ---
+def tab_shopping_list():
+    import database_async as adb
+    
+    plan_id = load_menu_plan()
+    if plan_id is None: return
     
-    # --- TAB 1: KALKULATOR ---
-    with tab1:
-        if 'menu_list' not in st.session_state: st.session_state.menu_list = []
-        
-        recipes = db.get_all_recipes()
-        if recipes is None or recipes.empty: 
-            st.warning("Belum ada data resep. Hubungi Admin.")
-            return
-        
-        r_dict = dict(zip(recipes['id'], recipes['name']))
-        l_dict = dict(zip(recipes['id'], recipes['source_link']))
+    # Data yang saling independen diambil bersamaan.
+    # Total belanja sudah teragregasi di tabel rencana, jadi tinggal dibaca.
+    with profiling.section("fetch_all"):
+        data = adb.fetch_all(recipes=(adb.get_all_recipes,), shopping=(adb.get_plan_totals, plan_id),
+                             prices=(adb.get_ingredient_prices,))
+    
+    recipes = data['recipes']
+    if recipes is None or recipes.empty: 
+        st.warning("Belum ada data resep. Hubungi Admin.")
+        return
+    
+    r_dict = dict(zip(recipes['id'], recipes['name']))
+    l_dict = dict(zip(recipes['id'], recipes['source_link']))
+    
+    c1, c2 = st.columns([1.2, 2])
+    with c1:
+        st.markdown("### 1️⃣ Pilih Menu")
+        st.info("Pilih masakan yang ingin dibuat dan tentukan porsinya. Rencana tersimpan otomatis.")
+        menu_plan_selector()
         
-        c1, c2 = st.columns([1.2, 2])
-        with c1:
-            st.markdown("### 1️⃣ Pilih Menu")
-            st.info("Pilih masakan yang ingin dibuat dan tentukan porsinya.")
-            
-            with st.container(border=True):
-                with st.form("add_menu"):
-                    sid = st.selectbox("Daftar Resep", list(r_dict.keys()), format_func=lambda x: r_dict[x])
-                    portion = st.number_input("Jumlah Porsi", min_value=1, value=1)
-                    if st.form_submit_button("Tambah ke Daftar", type="primary"):
+        with st.container(border=True):
+            with st.form("add_menu"):
+                sid = st.selectbox("Daftar Resep", list(r_dict.keys()), format_func=lambda x: r_dict[x])
+                portion = st.number_input("Jumlah Porsi", min_value=1, value=1)
+                if st.form_submit_button("Tambah ke Daftar", type="primary"):
+                    item_id = db.add_plan_item(plan_id, sid, portion)
+                    if item_id is not None:
                         st.session_state.menu_list.append({
-                            'id': sid, 'name': r_dict[sid], 'portions': portion, 'link': l_dict.get(sid)
+                            'item_id': item_id, 'id': sid, 'name': r_dict[sid], 'portions': portion, 'link': l_dict.get(sid)
                         })
                         show_success_toast("Menu berhasil ditambahkan!")
                         st.rerun()
+        
+        if st.session_state.menu_list:
+            if st.button("Reset Daftar Belanja") and db.clear_plan(plan_id):
+                st.session_state.menu_list = []
+                show_warning_toast("Daftar belanja dikosongkan.")
+                st.rerun()
+            
+            st.markdown("#### 📖 Panduan Masak")
+            for i in st.session_state.menu_list:
+                with st.expander(f"👨‍🍳 Cara Masak: {i['name']} ({i['portions']:g} porsi)"):
+                    if st.button("Hapus dari Daftar", key=f"rm_item_{i['item_id']}") and db.remove_plan_item(i['item_id']):
+                        st.session_state.menu_list.remove(i)
+                        show_warning_toast(f"{i['name']} dihapus dari daftar.")
+                        st.rerun()
+                    link = i['link']
+                    if link and len(link) > 5:
+                        if "youtube.com" in link or "youtu.be" in link:
+                            st.video(link)
+                        else:
+                            st.link_button("🔗 Buka Artikel Resep", link)
+                    else:
+                        st.caption("Tidak ada link sumber tersedia.")
+    
+    with c2:
+        st.markdown("### 2️⃣ Cek Stok & Belanja")
+        if st.session_state.menu_list:
+            st.success("Di bawah ini adalah total bahan yang dibutuhkan. Silakan isi kolom **'Stok di Rumah'** untuk mengurangi belanjaan.")
             
-            if st.session_state.menu_list:
-                if st.button("Reset Daftar Belanja"): 
-                    st.session_state.menu_list = []
-                    show_warning_toast("Daftar belanja dikosongkan.")
-                    st.rerun()
+            final = data['shopping']
+            
+            if final is not None:
+                final['Stok di Rumah'] = 0.0 # Default value
                 
-                st.markdown("#### 📖 Panduan Masak")
-                for i in st.session_state.menu_list:
-                    with st.expander(f"👨‍🍳 Cara Masak: {i['name']}"):
-                        link = i['link']
-                        if link and len(link) > 5:
-                            if "youtube.com" in link or "youtu.be" in link:
-                                st.video(link)
-                            else:
-                                st.link_button("🔗 Buka Artikel Resep", link)
-                        else:
-                            st.caption("Tidak ada link sumber tersedia.")
-        
-        with c2:
-            st.markdown("### 2️⃣ Cek Stok & Belanja")
-            if st.session_state.menu_list:
-                st.success("Di bawah ini adalah total bahan yang dibutuhkan. Silakan isi kolom **'Stok di Rumah'** untuk mengurangi belanjaan.")
+                edited = st.data_editor(
+                    final, 
+                    hide_index=True, 
+                    disabled=['ingredient_name','unit','total_quantity'],
+                    column_config={
+                        "ingredient_name": "Nama Bahan",
+                        "total_quantity": st.column_config.NumberColumn("Total Butuh", format="%.2f"),
+                        "Stok di Rumah": st.column_config.NumberColumn("Punya Stok Brp?", min_value=0, help="Isi jika sudah punya bahannya")
+                    }
+                )
                 
-                all_dfs = []
-                for i in st.session_state.menu_list:
-                    d = db.get_ingredients_by_recipe(i['id'])
-                    d['total_quantity'] = d['quantity'] * i['portions']
-                    all_dfs.append(d)
+                edited['Harus Beli'] = (edited['total_quantity'] - edited['Stok di Rumah']).clip(lower=0)
+                edited['Estimasi'] = utils.format_output_series(edited['Harus Beli'], edited['unit'])
+                costs = utils.compute_costs(edited, data['prices'], 'Harus Beli')
+                edited['Kemasan'] = utils.format_packs_series(costs, edited['unit'])
+                edited['Biaya'] = utils.format_rupiah_series(costs['cost'])
                 
-                if all_dfs:
-                    full = pd.concat(all_dfs)
-                    full = utils.normalize_units(full)
-                    final = full.groupby(['ingredient_name', 'unit'])['total_quantity'].sum().reset_index()
-                    final['Stok di Rumah'] = 0.0 # Default value
-                    
-                    edited = st.data_editor(
-                        final, 
-                        hide_index=True, 
-                        disabled=['ingredient_name','unit','total_quantity'],
-                        column_config={
-                            "ingredient_name": "Nama Bahan",
-                            "total_quantity": st.column_config.NumberColumn("Total Butuh", format="%.2f"),
-                            "Stok di Rumah": st.column_config.NumberColumn("Punya Stok Brp?", min_value=0, help="Isi jika sudah punya bahannya")
-                        }
-                    )
-                    
-                    edited['Harus Beli'] = (edited['total_quantity'] - edited['Stok di Rumah']).apply(lambda x: x if x>0 else 0)
-                    edited['Estimasi'] = edited.apply(lambda x: utils.format_output(x['Harus Beli'], x['unit']), axis=1)
-                    
-                    st.divider()
-                    st.markdown("#### 🧾 Final Daftar Belanja")
-                    st.dataframe(edited[['ingredient_name', 'Estimasi']], use_container_width=True)
-                    
+                st.divider()
+                st.markdown("#### 🧾 Final Daftar Belanja")
+                st.dataframe(edited[['ingredient_name', 'Estimasi', 'Kemasan', 'Biaya']], use_container_width=True)
+                c_cost, c_missing = st.columns([1, 1])
+                c_cost.metric("Perkiraan Biaya", utils.format_rupiah(costs['cost'].sum()))
+                n_missing = int(costs['cost'].isna().sum())
+                if n_missing: c_missing.caption(f"{n_missing} bahan belum punya harga dan tidak ikut dihitung.")
+                
+                # File baru dibuat setelah diminta, dan hanya selama isi daftar tidak berubah
+                digest = utils.frame_digest(edited[['ingredient_name', 'Estimasi']])
+                c_fmt, c_prep = st.columns([1, 1])
+                fmt = c_fmt.radio("Format File", ["xlsx", "csv"], horizontal=True, label_visibility="collapsed")
+                if c_prep.button("📄 Siapkan File Download"):
+                    st.session_state['export_digest'] = digest
+                
+                if st.session_state.get('export_digest') == digest:
+                    breakdown = None
+                    if fmt == 'xlsx':
+                        breakdown = db.get_shopping_breakdown(tuple((i['id'], i['portions']) for i in st.session_state.menu_list))
                     st.download_button(
-                        label="📥 Download Excel",
-                        data=utils.generate_excel(edited),
-                        file_name="Daftar_Belanja.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        label=f"📥 Download {fmt.upper()}",
+                        data=utils.export_shopping_list(edited, fmt, breakdown),
+                        file_name=f"Daftar_Belanja.{fmt}",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" if fmt == 'xlsx' else "text/csv",
                         type="primary"
                     )
-            else:
-                st.info("👈 Belum ada menu dipilih. Silakan pilih menu di panel sebelah kiri.")
+        else:
+            st.info("👈 Belum ada menu dipilih. Silakan pilih menu di panel sebelah kiri.")
 
-    # --- TAB 2: CARI RESEP ---
-    with tab2:
-        st.subheader("🔍 Punya bahan apa di kulkas?")
-        st.caption("Bingung mau masak apa? Centang bahan yang Anda miliki, kami akan carikan resepnya.")
-        
-        all_ings = db.get_all_unique_ingredients()
-        sel = st.multiselect("Pilih Bahan Tersedia:", all_ings, placeholder="Misal: Telur, Bawang, Ayam...")
-        
-        if st.button("Cari Inspirasi Resep", type="primary"):
-            if sel:
-                matches = db.find_matching_recipes(sel)
-                if matches:
-                    st.success(f"Hore! Ditemukan {len(matches)} resep yang relevan.")
-                    for m in matches:
-                        color = "green" if m['match_score']==100 else "orange"
-                        with st.expander(f"🥘 {m['name']} (Kecocokan: :{color}[{m['match_score']:.0f}%])"):
-                            if m['missing_count'] > 0: 
-                                st.warning(f"⚠️ **Bahan Kurang:** {', '.join(m['missing_ingredients'])}")
-                            else: 
-                                st.success("✅ Bahan Lengkap! Siap masak.")
-                            
-                            st.markdown("**Rincian Bahan:**")
-                            det = db.get_ingredients_by_recipe(m['id'])
-                            det['Jml'] = det.apply(lambda x: utils.format_indo(x['quantity']), axis=1)
-                            st.table(det[['ingredient_name', 'Jml', 'unit']])
-                            
-                            link = m['source_link']
-                            if link and len(link) > 5:
-                                st.markdown("---")
-                                if "youtube.com" in link or "youtu.be" in link:
-                                    st.video(link)
-                                else:
-                                    st.link_button("🔗 Lihat Sumber Resep", link)
-                else: 
-                    st.error("Belum ada resep yang cocok dengan kombinasi bahan tersebut.")
+# --- TAB 2: CARI RESEP ---
+def tab_recipe_finder():
+    st.subheader("🔍 Punya bahan apa di kulkas?")
+    st.caption("Bingung mau masak apa? Centang bahan yang Anda miliki, kami akan carikan resepnya.")
+    
+    # Hanya saran yang relevan yang dikirim ke multiselect, bukan seluruh nama bahan
+    q = st.text_input("Ketik nama bahan:", placeholder="Misal: bawang, telur, ayam...")
+    chosen = st.session_state.get('stock_sel', [])
+    options = list(dict.fromkeys(chosen + db.suggest_ingredients(q, 30)))
+    sel = st.multiselect("Pilih Bahan Tersedia:", options, key='stock_sel', placeholder="Misal: Telur, Bawang, Ayam...")
+    
+    if st.button("Cari Inspirasi Resep", type="primary"):
+        if sel:
+            # Dibatasi: bahan umum (mis. garam) cocok dengan hampir semua resep, tiap hasil = satu expander + query
+            matches = db.find_matching_recipes(sel, top_k=30)
+            if matches:
+                st.success(f"Hore! Ditemukan {len(matches)} resep paling relevan.")
+                for m in matches:
+                    color = "green" if m['match_score']==100 else "orange"
+                    with st.expander(f"🥘 {m['name']} (Kecocokan: :{color}[{m['match_score']:.0f}%])"):
+                        if m['missing_count'] > 0: 
+                            st.warning(f"⚠️ **Bahan Kurang:** {', '.join(m['missing_ingredients'])}")
+                        else: 
+                            st.success("✅ Bahan Lengkap! Siap masak.")
+                        
+                        st.markdown("**Rincian Bahan:**")
+                        det = db.get_ingredients_by_recipe(m['id'])
+                        det['Jml'] = det.apply(lambda x: utils.format_indo(x['quantity']), axis=1)
+                        st.table(det[['ingredient_name', 'Jml', 'unit']])
+                        
+                        link = m['source_link']
+                        if link and len(link) > 5:
+                            st.markdown("---")
+                            if "youtube.com" in link or "youtu.be" in link:
+                                st.video(link)
+                            else:
+                                st.link_button("🔗 Lihat Sumber Resep", link)
             else: 
-                st.toast("Pilih minimal satu bahan dulu ya!", icon='⚠️')
+                st.error("Belum ada resep yang cocok dengan kombinasi bahan tersebut.")
+        else: 
+            st.toast("Pilih minimal satu bahan dulu ya!", icon='⚠️')
+
+# --- TAB 3: BANDINGKAN BIAYA ---
+def tab_cost_compare():
+    st.subheader("💰 Bandingkan Biaya Rencana Menu")
+    st.caption("Biaya semua rencana dihitung sekaligus, dengan pembelian dibulatkan ke ukuran kemasan.")
+    
+    plans = db.get_user_plans(st.session_state['username'])
+    if plans is None or plans.empty:
+        st.info("Belum ada rencana menu.")
+        return
+    names = dict(zip(plans['id'], plans['name']))
+    c1, c2 = st.columns([2, 1])
+    picked = c1.multiselect("Rencana yang dibandingkan", list(names), default=list(names), format_func=lambda x: names[x])
+    scale = c2.number_input("Kali lipat porsi (katering)", min_value=1.0, value=1.0, step=1.0)
+    if not picked: return
+    
+    totals = db.get_plans_totals(picked)
+    if totals is None: return
+    res = utils.compare_menu_costs(totals.rename(columns={'plan_id': 'menu'}), db.get_ingredient_prices(), scale)
+    res = plans[plans['id'].isin(picked)].merge(res, left_on='id', right_on='menu', how='left').fillna(
+        {'total_cost': 0, 'priced_items': 0, 'missing_prices': 0})
+    res['portions'] = res['portions'] * scale
+    res['per_portion'] = res['total_cost'] / res['portions'].where(res['portions'] > 0)
+    res = res.sort_values('total_cost')
+    st.dataframe(
+        res[['name', 'dishes', 'portions', 'total_cost', 'per_portion', 'missing_prices']],
+        hide_index=True, use_container_width=True,
+        column_config={
+            "name": "Rencana", "dishes": "Masakan",
+            "portions": st.column_config.NumberColumn("Total Porsi", format="%.0f"),
+            "total_cost": st.column_config.NumberColumn("Total Biaya", format="Rp %.0f"),
+            "per_portion": st.column_config.NumberColumn("Biaya/Porsi", format="Rp %.0f"),
+            "missing_prices": st.column_config.NumberColumn("Bahan Tanpa Harga", format="%d"),
+        }
+    )
+    if res['missing_prices'].sum():
+        st.caption("Bahan tanpa harga tidak ikut dihitung. Admin dapat melengkapinya di menu Resep → Harga Bahan.")
 
 def page_manage_recipes():
     st.title("🛠️ Kelola Database Resep")
     st.caption("Admin Area: Tambah, Edit, atau Hapus resep dan bahan masakan.")
     
-    t1, t2, t3 = st.tabs(["➕ Tambah Resep", "✏️ Edit Resep & Bahan", "🗑️ Hapus Resep"])
-    
-    # TAB 1: TAMBAH
-    with t1:
-        st.markdown("### Buat Resep Baru")
-        with st.container(border=True):
-            n = st.text_input("Nama Masakan")
-            l = st.text_input("Link Sumber (YouTube/Blog)")
-            if st.button("Simpan Resep Baru", type="primary"):
-                if n:
-                    db.add_recipe_to_db(n, l)
-                    show_success_toast(f"Resep '{n}' berhasil dibuat!")
+    lazy_tabs({"➕ Tambah Resep": tab_add_recipe, "✏️ Edit Resep & Bahan": tab_edit_recipe,
+               "🗑️ Hapus Resep": tab_delete_recipe, "📦 Import/Export Massal": tab_bulk_recipes,
+               "💲 Harga Bahan": tab_ingredient_prices}, key='recipe_tab')
+
+# TAB 1: TAMBAH
+def tab_add_recipe():
+    st.markdown("### Buat Resep Baru")
+    with st.container(border=True):
+        n = st.text_input("Nama Masakan")
+        l = st.text_input("Link Sumber (YouTube/Blog)")
+        if st.button("Simpan Resep Baru", type="primary"):
+            if n:
+                db.add_recipe_to_db(n, l)
+                show_success_toast(f"Resep '{n}' berhasil dibuat!")
+                st.rerun()
+            else:
+                st.toast("Nama resep wajib diisi!", icon='⚠️')
+
+# TAB 2: EDIT
+def tab_edit_recipe():
+    st.markdown("### Update Data Resep")
+    picked = paged_picker("Resep untuk Diedit", db.search_recipes, 'id', 'name', key='edit_res')
+    if picked is not None:
+        sid, cur = picked
+        
+        with st.expander("📝 Edit Informasi Utama (Nama & Link)", expanded=False):
+            with st.form("edit_info"):
+                nn = st.text_input("Nama Resep", cur['name'])
+                nl = st.text_input("Link Sumber", cur['source_link'])
+                if st.form_submit_button("Simpan Perubahan Info"):
+                    db.update_recipe_data(sid, nn, nl)
+                    show_success_toast("Informasi resep diperbarui!")
                     st.rerun()
-                else:
-                    st.toast("Nama resep wajib diisi!", icon='⚠️')
-    
-    # TAB 2: EDIT
-    with t2:
-        st.markdown("### Update Data Resep")
-        df = db.get_all_recipes()
-        if df is not None and not df.empty:
-            rd = dict(zip(df['id'], df['name']))
-            sid = st.selectbox("Pilih Resep untuk Diedit", list(rd.keys()), format_func=lambda x: rd[x])
-            cur = df[df['id']==sid].iloc[0]
-            
-            with st.expander("📝 Edit Informasi Utama (Nama & Link)", expanded=False):
-                with st.form("edit_info"):
-                    nn = st.text_input("Nama Resep", cur['name'])
-                    nl = st.text_input("Link Sumber", cur['source_link'])
-                    if st.form_submit_button("Simpan Perubahan Info"):
-                        db.update_recipe_data(sid, nn, nl)
-                        show_success_toast("Informasi resep diperbarui!")
+        
+        st.markdown("#### Daftar Bahan Masakan")
+        cur_ing = db.get_ingredients_by_recipe(sid)
+        
+        if cur_ing is not None:
+            if cur_ing.empty: st.info("Resep ini belum memiliki bahan.")
+            st.caption("Ubah langsung di tabel, tambah baris di bawahnya, atau pilih baris lalu hapus. "
+                       "Semua perubahan disimpan sekaligus dalam satu transaksi.")
+            edited_ing = st.data_editor(
+                cur_ing,
+                key=f"ing_grid_{sid}",
+                num_rows="dynamic",
+                hide_index=True,
+                use_container_width=True,
+                column_order=['ingredient_name', 'quantity', 'unit'],
+                column_config={
+                    "ingredient_name": st.column_config.TextColumn("Nama Bahan", required=True),
+                    "quantity": st.column_config.NumberColumn("Jumlah", min_value=0.0, step=0.1),
+                    "unit": st.column_config.TextColumn("Satuan")
+                }
+            )
+            if st.button("💾 Simpan Semua Perubahan Bahan", type="primary"):
+                res = db.save_recipe_ingredients(sid, cur_ing, edited_ing)
+                if res is not None:
+                    show_success_toast(f"Bahan disimpan: {res['inserted']} baru, {res['updated']} diubah, {res['deleted']} dihapus.")
+                    st.rerun()
+        
+        st.divider()
+        st.markdown("#### ➕ Tambah Bahan Baru")
+        with st.container(border=True):
+            with st.form("new_ing"):
+                c1,c2,c3 = st.columns(3)
+                n = c1.text_input("Nama Bahan Baru")
+                q = c2.number_input("Jumlah", step=0.1, min_value=0.0)
+                u = c3.text_input("Satuan")
+                if st.form_submit_button("Tambahkan Bahan"):
+                    if n:
+                        db.add_ingredient_to_db(sid, n, q, u)
+                        show_success_toast("Bahan berhasil ditambahkan!")
                         st.rerun()
-            
-            st.markdown("#### Daftar Bahan Masakan")
-            cur_ing = db.get_ingredients_by_recipe(sid)
-            
-            if not cur_ing.empty:
-                cur_ing['disp'] = cur_ing.apply(lambda x: utils.format_indo(x['quantity']), axis=1)
-                st.table(cur_ing[['ingredient_name','disp','unit']])
-                
-                with st.expander("✏️ Edit atau Hapus Bahan Tertentu"):
-                    id_ing = st.selectbox("Pilih Bahan", cur_ing['id'], format_func=lambda x: cur_ing[cur_ing['id']==x]['ingredient_name'].values[0])
-                    row = cur_ing[cur_ing['id']==id_ing].iloc[0]
-                    
-                    c1,c2,c3 = st.columns(3)
-                    en = c1.text_input("Nama Bahan", row['ingredient_name'])
-                    eq = c2.number_input("Jumlah", value=float(row['quantity']), step=0.1)
-                    eu = c3.text_input("Satuan", row['unit'])
-                    
-                    c_btn1, c_btn2 = st.columns(2)
-                    with c_btn1:
-                        if st.button("Simpan Perubahan Bahan"):
-                            db.update_ingredient_data(id_ing, en, eq, eu)
-                            show_success_toast("Data bahan diperbarui!")
-                            st.rerun()
-                    with c_btn2:
-                        if st.button("Hapus Bahan Ini", type="primary"):
-                            db.delete_ingredient_data(id_ing)
-                            show_warning_toast("Bahan dihapus.")
-                            st.rerun()
-            else:
-                st.info("Resep ini belum memiliki bahan.")
-            
-            st.divider()
-            st.markdown("#### ➕ Tambah Bahan Baru")
-            with st.container(border=True):
-                with st.form("new_ing"):
-                    c1,c2,c3 = st.columns(3)
-                    n = c1.text_input("Nama Bahan Baru")
-                    q = c2.number_input("Jumlah", step=0.1, min_value=0.0)
-                    u = c3.text_input("Satuan")
-                    if st.form_submit_button("Tambahkan Bahan"):
-                        if n:
-                            db.add_ingredient_to_db(sid, n, q, u)
-                            show_success_toast("Bahan berhasil ditambahkan!")
-                            st.rerun()
-                        else:
-                            st.toast("Nama bahan tidak boleh kosong", icon='⚠️')
+                    else:
+                        st.toast("Nama bahan tidak boleh kosong", icon='⚠️')
+
+# TAB 3: HAPUS
+def tab_delete_recipe():
+    st.markdown("### Hapus Resep Permanen")
+    st.warning("Hati-hati! Menghapus resep akan menghapus semua bahan di dalamnya juga.")
+    picked = paged_picker("Resep yang akan dihapus", db.search_recipes, 'id', 'name', key='del_res')
+    if picked is not None:
+        did, _ = picked
+        
+        if st.button("Ya, Hapus Resep Ini", type="primary"):
+            db.delete_recipe_from_db(did)
+            show_warning_toast("Resep telah dihapus permanen.")
+            st.rerun()
+
+# TAB 4: IMPORT / EXPORT MASSAL
+def tab_bulk_recipes():
+    st.markdown("### Import Resep dari File")
+    st.caption("Satu baris per bahan dengan kolom: recipe_name, source_link, ingredient_name, quantity, unit. "
+               "Resep dengan nama yang sudah ada akan diganti bahannya.")
+    with st.container(border=True):
+        up = st.file_uploader("File CSV / JSON / Parquet", type=['csv', 'json', 'parquet'])
+        if up is not None and st.button("Import Sekarang", type="primary"):
+            try:
+                imp = utils.read_recipe_file(up, up.name)
+                res = db.bulk_import_recipes(imp)
+                st.success(f"{res['recipes_new']} resep baru, {res['recipes_updated']} diperbarui, "
+                           f"{res['ingredients']} bahan dalam {res['seconds']:.2f} detik "
+                           f"({res['rows_per_sec']:,.0f} baris/detik).")
+            except Exception as e:
+                st.error(f"Import gagal: {e}")
     
-    # TAB 3: HAPUS
-    with t3:
-        st.markdown("### Hapus Resep Permanen")
-        st.warning("Hati-hati! Menghapus resep akan menghapus semua bahan di dalamnya juga.")
-        df = db.get_all_recipes()
-        if df is not None and not df.empty:
-            rd = dict(zip(df['id'], df['name']))
-            did = st.selectbox("Pilih Resep yang akan dihapus", list(rd.keys()), format_func=lambda x: rd[x], key='del_res')
-            
-            if st.button("Ya, Hapus Resep Ini", type="primary"):
-                db.delete_recipe_from_db(did)
-                show_warning_toast("Resep telah dihapus permanen.")
-                st.rerun()
+    st.markdown("### Export Seluruh Resep")
+    if st.button("📄 Siapkan Export CSV"):
+        try:
+            st.session_state['bulk_export'] = db.bulk_export_recipes()
+        except Exception as e:
+            st.error(f"Export gagal: {e}")
+    if 'bulk_export' in st.session_state:
+        data, res = st.session_state['bulk_export']
+        st.caption(f"{res['rows']} baris dalam {res['seconds']:.2f} detik ({res['rows_per_sec']:,.0f} baris/detik).")
+        st.download_button("📥 Download Katalog Resep", data=data, file_name="Katalog_Resep.csv", mime="text/csv")
+
+# TAB 5: HARGA BAHAN
+def tab_ingredient_prices():
+    st.markdown("### Harga & Ukuran Kemasan Bahan")
+    st.caption("Satu baris per bahan, nama dicocokkan tanpa membedakan huruf besar/kecil. "
+               "Biaya belanja dihitung per kemasan (dibulatkan ke atas).")
+    prices = db.get_ingredient_prices()
+    if prices is None: return
+    
+    edited = st.data_editor(
+        prices,
+        key='price_grid',
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_order=['display_name', 'pack_size', 'pack_unit', 'pack_price'],
+        column_config={
+            "display_name": st.column_config.TextColumn("Nama Bahan", required=True),
+            "pack_size": st.column_config.NumberColumn("Isi Kemasan", min_value=0.0, required=True),
+            "pack_unit": st.column_config.TextColumn("Satuan", required=True),
+            "pack_price": st.column_config.NumberColumn("Harga/Kemasan (Rp)", min_value=0, format="%.0f", required=True)
+        }
+    )
+    if st.button("💾 Simpan Harga", type="primary"):
+        res = db.save_ingredient_prices(prices, edited)
+        if res is not None:
+            show_success_toast(f"Harga disimpan: {res['saved']} diubah, {res['deleted']} dihapus.")
+            st.rerun()
+    
+    catalog = db.get_ingredient_catalog()
+    if catalog is not None:
+        unpriced = catalog[~catalog['ingredient_key'].isin(prices['ingredient_key'])].head(15)
+        if not unpriced.empty:
+            st.caption("Bahan populer yang belum punya harga: " + ", ".join(unpriced['display_name']))
 
 def page_manage_users():
     st.title("👥 Kelola Pengguna")
@@ -370,14 +599,12 @@ def page_manage_users():
     
     with col_r:
         st.markdown("### Daftar User")
-        udf = db.get_all_users()
-        if udf is not None: 
-            st.dataframe(udf, use_container_width=True)
+        picked = paged_picker("User", db.search_users, 'username', 'username', key='users', show_table=True)
         
-        if udf is not None and not udf.empty:
+        if picked is not None:
             st.divider()
             st.markdown("#### Edit / Hapus User")
-            us = st.selectbox("Pilih User", udf['username'])
+            us, _ = picked
             
             with st.form("eu"):
                 np = st.text_input("Password Baru (Kosongkan jika tidak ubah)", type='password')
@@ -398,6 +625,57 @@ def page_manage_users():
                 else: 
                     st.toast("Tidak bisa menghapus akun sendiri!", icon='⛔')
 
+def page_metrics():
+    st.title("📈 Metrik Database")
+    st.caption("Admin Area: Latensi query per fungsi & halaman, query lambat, pool koneksi dan cache.")
+    reg = metrics.get_registry()
+    
+    c1, c2, c3, c4 = st.columns(4)
+    ps, cs = db.get_pool_stats(), db.get_cache_stats()
+    c1.metric("Koneksi Dipakai", f"{ps['in_use']}/{ps['max_size']}")
+    c2.metric("Rata-rata Tunggu Pool", f"{ps['avg_wait_ms']:.1f} ms")
+    c3.metric("Cache Hit", f"{cs['hit_rate']:.0%}")
+    c4.metric("Versi Katalog", cs['version'])
+    
+    st.markdown("### Query per Fungsi")
+    rows = reg.rows()
+    if rows:
+        st.dataframe([{k: v for k, v in r.items() if k != 'buckets'} for r in rows], use_container_width=True,
+                     column_config={"avg_ms": st.column_config.NumberColumn("Rata-rata (ms)", format="%.2f"),
+                                    "max_ms": st.column_config.NumberColumn("Maks (ms)", format="%.2f"),
+                                    "avg_build_ms": st.column_config.NumberColumn("Bangun DataFrame (ms)", format="%.2f")})
+    else:
+        st.info("Belum ada query yang tercatat.")
+    
+    st.markdown(f"### Query Lambat (≥ {reg.slow_ms:.0f} ms)")
+    slow = reg.slow_queries()
+    if slow: st.dataframe(slow[::-1], use_container_width=True)
+    else: st.caption("Tidak ada query lambat.")
+    
+    st.markdown("### Statistik Katalog")
+    stats = db.get_catalog_stats()
+    if stats:
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Resep", f"{stats['recipes']:,}")
+        k2.metric("Baris Bahan", f"{stats['ingredient_rows']:,}")
+        k3.metric("Bahan Unik", f"{stats['unique_ingredients']:,}")
+        k4.metric("Rata-rata Bahan/Resep", f"{float(stats['avg_ingredients']):.1f}")
+        st.dataframe([{'bahan': k, 'resep': n} for k, n in stats['top_ingredients']], hide_index=True, use_container_width=True)
+        if stats['source'] == 'snapshot': st.caption(f"Dari snapshot kolumnar v{cs['version']} ({stats['snapshot_mib']:.1f} MiB, memory-mapped)")
+        else: st.caption("Dari database (snapshot kolumnar tidak aktif atau belum siap)")
+    
+    st.divider()
+    c_exp, c_json, c_prom, c_reset = st.columns(4)
+    path = config.get_setting("METRICS_FILE", "metrics.prom")
+    if c_exp.button("💾 Tulis ke File"):
+        show_success_toast(f"Metrik ditulis ke {reg.export(path)}")
+    c_json.download_button("📥 JSON", reg.to_json(), file_name="metrics.json", mime="application/json")
+    c_prom.download_button("📥 Prometheus", reg.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+    if c_reset.button("Reset Metrik"):
+        reg.reset()
+        st.rerun()
+
 if __name__ == '__main__':
     main()
+    profiling.finish()
 
@@ -0,0 +1,172 @@
+# benchmark.py
+"""Benchmark jalur panas database.py dan utils.py terhadap katalog sintetis.
+
+Contoh:
+    python benchmark.py --sizes 1000,10000,100000
+    BENCH_DATABASE_URL=postgresql://localhost/postgres python benchmark.py --sizes 1000,100000
+    python benchmark.py --compare HEAD~1
+
+Tanpa DSN hanya benchmark in-process (index pencarian, normalisasi satuan, export)
+yang dijalankan. Dengan DSN, katalog dimuat ke schema sementara `bench_<pid>` yang
+dihapus lagi di akhir. Hasil ditambahkan ke bench_results.jsonl bersama hash commit.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import pandas as pd
+
+BASE_NAMES = ['bawang merah', 'bawang putih', 'cabai merah', 'cabai rawit', 'garam', 'gula pasir', 'minyak goreng',
+              'telur', 'kecap manis', 'tomat', 'jahe', 'kunyit', 'lengkuas', 'serai', 'daun salam', 'santan',
+              'ayam', 'daging sapi', 'udang', 'tahu', 'tempe', 'nasi putih', 'tepung terigu', 'merica', 'ketumbar',
+              'kemiri', 'air', 'susu cair', 'wortel', 'kentang', 'kol', 'buncis', 'daun bawang', 'seledri', 'madu']
+MODIFIERS = ['', 'segar', 'kering', 'bubuk', 'iris', 'cincang', 'organik', 'beku', 'halus', 'kampung']
+UNITS = [('gram', 50, 500), ('kg', 0.25, 2), ('ml', 10, 250), ('liter', 0.25, 1), ('sdm', 1, 4),
+         ('sdt', 1, 3), ('butir', 1, 6), ('siung', 2, 8), ('buah', 1, 4), ('ons', 1, 5)]
+
+def generate_catalogue(n_ingredients, per_recipe=8, seed=42):
+    """Katalog format panjang (utils.RECIPE_FILE_COLUMNS) dengan popularitas nama bahan mengikuti Zipf."""
+    rng = random.Random(seed)
+    vocab = [f"{b} {m}".strip() for m in MODIFIERS for b in BASE_NAMES]
+    # Variasi ejaan/kapitalisasi kecil agar mirip data nyata
+    vocab += [v.title() for v in vocab[:len(BASE_NAMES)]]
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(vocab))]
+    n_recipes = max(1, n_ingredients // per_recipe)
+    rows = []
+    for r in range(n_recipes):
+        name = f"Resep {r:07d}"
+        link = f"https://contoh.id/resep/{r}"
+        for ing in set(rng.choices(vocab, weights, k=per_recipe)):
+            unit, lo, hi = rng.choice(UNITS)
+            rows.append((name, link, ing, round(rng.uniform(lo, hi), 2), unit))
+    return pd.DataFrame(rows, columns=['recipe_name', 'source_link', 'ingredient_name', 'quantity', 'unit'])
+
+def measure(fn, repeat):
+    """Return dict p50/p99 (ms) dan puncak alokasi memori Python (KiB).
+
+    Memori diukur di satu putaran terpisah karena tracemalloc ikut memperlambat waktu.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    q = statistics.quantiles(times, n=100, method='inclusive') if len(times) > 1 else times * 99
+    return {'p50_ms': round(statistics.median(times), 3), 'p99_ms': round(q[98], 3),
+            'peak_kib': round(peak / 1024, 1), 'repeat': repeat}
+
+def inprocess_cases(cat):
+    import database as db
+    import utils
+    recipes = cat[['recipe_name', 'source_link']].drop_duplicates('recipe_name').reset_index(drop=True)
+    recipes.insert(0, 'id', recipes.index + 1)
+    recipes = recipes.rename(columns={'recipe_name': 'name'})
+    ings = cat.merge(recipes[['id', 'name']], left_on='recipe_name', right_on='name')
+    ings = ings.rename(columns={'id': 'recipe_id'})
+    index = db.RecipeIndex(recipes, ings)
+    picks = cat['ingredient_name'].value_counts().index[:5].tolist()
+    shopping = cat[['ingredient_name', 'quantity', 'unit']].rename(columns={'quantity': 'total_quantity'})
+    est = shopping.assign(Estimasi=utils.format_output_series(shopping['total_quantity'], shopping['unit']))
+    return {
+        'recipe_index_build': lambda: db.RecipeIndex(recipes, ings),
+        'recipe_index_search': lambda: index.search(picks),
+        'recipe_index_search_top10': lambda: index.search(picks, top_k=10),
+        'normalize_units': lambda: utils.normalize_units(shopping.copy()),
+        'format_output_series': lambda: utils.format_output_series(shopping['total_quantity'], shopping['unit']),
+        'generate_excel': lambda: utils.generate_excel(est),
+        'generate_csv': lambda: utils.generate_csv(est),
+    }
+
+def db_cases(cat):
+    import database as db
+    db.setup_database()
+    db.bulk_import_recipes(cat)
+    recipes = db.get_all_recipes()
+    menu = [(int(r), 10) for r in recipes['id'].sample(min(30, len(recipes)), random_state=1)]
+    picks = cat['ingredient_name'].value_counts().index[:5].tolist()
+
+    def cold_match():
+        db.catalog_changed()
+        db.find_matching_recipes(picks)
+    return {
+        'db_find_matching_cold': cold_match,
+        'db_find_matching_warm': lambda: db.find_matching_recipes(picks),
+        'db_shopping_list_30': lambda: db.get_shopping_list(menu),
+        'db_unique_ingredients': lambda: db._get_all_unique_ingredients.__wrapped__(),
+        'db_all_recipes': lambda: db.get_all_recipes.__wrapped__(),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(path, ref):
+    """Bandingkan hasil commit terakhir di file dengan hasil commit `ref`."""
+    with open(path) as f: rows = [json.loads(line) for line in f]
+    if not rows: return
+    ref = subprocess.check_output(['git', 'rev-parse', '--short', ref], text=True).strip()
+    latest = rows[-1]['commit']
+    base = {(r['case'], r['size']): r for r in rows if r['commit'] == ref}
+    print(f"{'case':32} {'size':>8} {ref:>10} {latest:>10} {'delta':>8}")
+    for r in rows:
+        if r['commit'] != latest or (r['case'], r['size']) not in base: continue
+        old = base[(r['case'], r['size'])]['p50_ms']
+        delta = (r['p50_ms'] - old) / old * 100 if old else 0.0
+        print(f"{r['case']:32} {r['size']:>8} {old:>10.2f} {r['p50_ms']:>10.2f} {delta:>+7.1f}%")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--sizes', default='1000,10000,100000', help="jumlah baris bahan, dipisah koma")
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'), help="Postgres sekali pakai (opsional)")
+    ap.add_argument('--out', default='bench_results.jsonl')
+    ap.add_argument('--compare', metavar='REF', help="bandingkan dengan hasil commit REF di --out")
+    args = ap.parse_args()
+    if args.compare:
+        compare(args.out, args.compare)
+        return
+
+    schema = None
+    if args.dsn:
+        import psycopg2
+        import psycopg2.extensions
+        schema = f"bench_{os.getpid()}"
+        admin = psycopg2.connect(args.dsn); admin.autocommit = True
+        admin.cursor().execute(f"CREATE SCHEMA {schema}")
+        os.environ['DATABASE_URL'] = psycopg2.extensions.make_dsn(args.dsn, options=f"-c search_path={schema},public")
+
+    commit = git_commit()
+    try:
+        with open(args.out, 'a') as out:
+            for size in [int(s) for s in args.sizes.split(',')]:
+                cat = generate_catalogue(size)
+                cases = inprocess_cases(cat)
+                if schema: cases.update(db_cases(cat))
+                for name, fn in cases.items():
+                    res = measure(fn, args.repeat)
+                    row = {'commit': commit, 'ts': int(time.time()), 'case': name, 'size': size, **res}
+                    out.write(json.dumps(row) + '\n')
+                    print(f"{name:32} {size:>8} p50={res['p50_ms']:>9.2f}ms p99={res['p99_ms']:>9.2f}ms peak={res['peak_kib']:>10.1f}KiB")
+                if schema:
+                    import database as db
+                    db.run_query("TRUNCATE recipes, ingredients, ingredient_catalog RESTART IDENTITY CASCADE")
+    finally:
+        if schema:
+            import database as db
+            db.get_pool()._pool.closeall()
+            admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+            admin.close()
+
+if __name__ == '__main__':
+    main()
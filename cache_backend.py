@@ -0,0 +1,113 @@
+# cache_backend.py
+"""Backend key-value bersama untuk cache katalog dan data sesi antar replika aplikasi.
+
+Antarmukanya subset Redis (get / set(ex=) / delete / incr / ping) dengan nilai bytes,
+sehingga klien redis-py bisa langsung dipakai. Dipilih lewat CACHE_BACKEND:
+
+    memory (default)         dict per proses, tidak dibagi antar replika
+    sqlite:///path/cache.db  file SQLite, dibagi oleh proses di host yang sama
+    redis://host:6379/0      Redis (butuh paket redis)
+"""
+import streamlit as st
+import sqlite3
+import threading
+import time
+from config import get_setting
+
+class MemoryBackend:
+    shared = False
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._data[key]
+                return None
+            return item[0]
+
+    def set(self, key, value, ex=None):
+        with self._lock: self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock: return sum(self._data.pop(k, None) is not None for k in keys)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0]) + amount
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+    def ping(self): return True
+
+class SQLiteBackend:
+    """Tabel kv(key, value, expires) dalam mode WAL; entri kedaluwarsa dibersihkan berkala saat set."""
+    shared = True
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value FROM kv WHERE key=? AND (expires IS NULL OR expires > ?)",
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ex=None):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                     (key, value, time.time() + ex if ex else None))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        return True
+
+    def delete(self, *keys):
+        if not keys: return 0
+        return self._conn().execute(f"DELETE FROM kv WHERE key IN ({','.join('?' * len(keys))})", keys).rowcount
+
+    def incr(self, key, amount=1):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key=?", (key,)).fetchone()
+            value = int(row[0]) + amount if row else amount
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, NULL)", (key, str(value).encode()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def ping(self):
+        self._conn().execute("SELECT 1")
+        return True
+
+def make_backend(url):
+    if not url or url == 'memory': return MemoryBackend()
+    if url.startswith('sqlite:///'): return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis # opsional, hanya jika CACHE_BACKEND menunjuk ke Redis
+        client = redis.Redis.from_url(url)
+        client.shared = True
+        return client
+    raise ValueError(f"CACHE_BACKEND tidak dikenal: {url}")
+
+@st.cache_resource
+def get_backend():
+    return make_backend(get_setting("CACHE_BACKEND", "memory"))
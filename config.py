@@ -0,0 +1,15 @@
+# config.py
+import os
+import streamlit as st
+
+def get_setting(name, default=None):
+    """Baca konfigurasi dari environment variable, lalu st.secrets.
+
+    Environment didahulukan agar skrip headless (benchmark, load test) bisa
+    berjalan tanpa file secrets.toml.
+    """
+    if name in os.environ: return os.environ[name]
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError: # belum ada secrets.toml
+        return default
@@ -1,94 +1,739 @@
 # database.py
 import streamlit as st
 import psycopg2
-import hashlib
+import psycopg2.extensions
+import psycopg2.extras
+from psycopg2 import pool as pg_pool
+import functools
+import heapq
+import pickle
+import select
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from io import BytesIO, StringIO
 import pandas as pd
+import cache_backend
+import fuzzy
+import metrics
+import security
+import snapshot
+import utils
+from config import get_setting
 
 # --- KONEKSI & SECURITY ---
 
-def init_connection():
-    return psycopg2.connect(st.secrets["DATABASE_URL"])
+class ConnectionPool:
+    """Pool koneksi Postgres yang dipakai bersama oleh semua sesi dalam satu proses.
+
+    Checkout menunggu (bukan langsung error) jika pool penuh, koneksi dicek dulu
+    sebelum dipakai dan otomatis diganti jika sudah putus.
+    """
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30):
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.minconn, self.maxconn, self.timeout = minconn, maxconn, timeout
+        self.in_use = 0
+        self.checkouts = 0
+        self.reconnects = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def _is_healthy(conn):
+        if conn.closed: return False
+        try:
+            with conn.cursor() as c: c.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """`timeout` = lama menunggu slot kosong (default `self.timeout`, 0 = tidak menunggu)."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            raise pg_pool.PoolError(f"Pool koneksi penuh ({self.maxconn}) setelah menunggu {timeout} detik")
+        waited = time.perf_counter() - start
+        try:
+            # Setelah Postgres restart, semua koneksi idle biasanya sudah mati: buang satu per satu
+            # sampai dapat yang hidup; paling lambat setelah maxconn kali pool membuka koneksi baru
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn): break
+                self._pool.putconn(conn, close=True)
+                with self._lock: self.reconnects += 1
+            else:
+                raise pg_pool.PoolError("Tidak mendapat koneksi yang sehat dari pool")
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed and \
+                    conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        except psycopg2.Error:
+            self._pool.putconn(conn, close=True)
+        finally:
+            with self._lock: self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'min_size': self.minconn, 'max_size': self.maxconn, 'in_use': self.in_use,
+                'utilization': self.in_use / self.maxconn, 'checkouts': self.checkouts,
+                'reconnects': self.reconnects,
+                'avg_wait_ms': (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+@st.cache_resource
+def get_pool():
+    return ConnectionPool(
+        get_setting("DATABASE_URL"),
+        minconn=int(get_setting("DB_POOL_MIN", 1)),
+        maxconn=int(get_setting("DB_POOL_MAX", 10)),
+        timeout=float(get_setting("DB_POOL_TIMEOUT", 30)),
+    )
+
+@st.cache_resource
+def get_db_settings():
+    return SimpleNamespace(
+        read_timeout_ms=int(get_setting("DB_READ_TIMEOUT_MS", 10000)),
+        write_timeout_ms=int(get_setting("DB_WRITE_TIMEOUT_MS", 30000)),
+        search_timeout_ms=int(get_setting("DB_SEARCH_TIMEOUT_MS", 3000)),
+        sticky_seconds=float(get_setting("DB_STICKY_SECONDS", 10)),
+    )
+
+class ReplicaRouter:
+    """Pool ke replika baca (DATABASE_REPLICA_URL), dibuat saat pertama dipakai.
+
+    Jika replika gagal dihubungi, semua bacaan dialihkan ke primary selama `retry` detik.
+    Jika pool replika hanya penuh, hanya panggilan itu yang langsung dialihkan (tanpa menunggu).
+    Status down juga dipakai database_async.
+    """
+    def __init__(self, dsn, retry=30, **pool_args):
+        self.dsn, self.retry, self.pool_args = dsn, retry, pool_args
+        self.pool = None
+        self.down_until = 0.0
+        self.reads = self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return (pool, koneksi) replika, atau None jika replika sedang tidak tersedia."""
+        if not self.available(): return None
+        try:
+            with self._lock:
+                if self.pool is None: self.pool = ConnectionPool(self.dsn, **self.pool_args)
+            conn = self.pool.getconn(timeout=0)
+        except pg_pool.PoolError:
+            self.fell_back()
+            return None
+        except psycopg2.Error:
+            self.mark_down()
+            return None
+        with self._lock: self.reads += 1
+        return self.pool, conn
+
+    def available(self): return time.monotonic() >= self.down_until
+
+    def fell_back(self):
+        with self._lock: self.fallbacks += 1
+
+    def mark_down(self):
+        with self._lock:
+            self.down_until = time.monotonic() + self.retry
+            self.fallbacks += 1
+
+    def stats(self):
+        with self._lock:
+            return {'reads': self.reads, 'fallbacks': self.fallbacks, 'up': self.available()}
+
+@st.cache_resource
+def get_replica():
+    dsn = get_setting("DATABASE_REPLICA_URL")
+    if not dsn: return None
+    return ReplicaRouter(
+        dsn,
+        retry=float(get_setting("DB_REPLICA_RETRY", 30)),
+        minconn=int(get_setting("DB_POOL_MIN", 1)),
+        maxconn=int(get_setting("DB_POOL_MAX", 10)),
+    )
+
+def _session_state():
+    try:
+        return st.session_state
+    except Exception: # di luar runtime Streamlit
+        return {}
+
+def mark_write():
+    _session_state()['_db_last_write'] = time.monotonic()
+
+def recently_wrote():
+    """True selama DB_STICKY_SECONDS setelah sesi ini menulis; bacaannya tetap ke primary (read-your-writes)."""
+    last = _session_state().get('_db_last_write')
+    return last is not None and time.monotonic() - last < get_db_settings().sticky_seconds
+
+@contextmanager
+def get_connection(replica=False):
+    """Koneksi dari pool primary, atau dari replika jika `replica=True`, replika tersedia
+    dan sesi ini tidak baru saja menulis."""
+    router = get_replica() if replica and not recently_wrote() else None
+    acquired = router.acquire() if router is not None else None
+    if acquired is None:
+        router = None
+        p = get_pool()
+        conn = p.getconn()
+    else:
+        p, conn = acquired
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        broken = not isinstance(e, psycopg2.extensions.QueryCanceledError)
+        if broken and router is not None: router.mark_down()
+        raise
+    finally:
+        p.putconn(conn, close=broken)
+
+def get_pool_stats(): return get_pool().stats()
+
+def get_replica_stats():
+    router = get_replica()
+    return router.stats() if router is not None else None
+
+# --- CACHE KATALOG ---
+
+class CatalogCache:
+    """Cache baca resep/bahan bersama (per proses) dengan TTL, batas ukuran (LRU) dan versi katalog.
+
+    Setiap penulisan resep/bahan menaikkan `version`, sehingga entri lama tidak
+    terbaca lagi oleh sesi mana pun. Versi berasal dari sequence Postgres
+    `catalog_version` dan disiarkan lewat NOTIFY, jadi sama di semua replika; jika
+    `backend` dibagi antar proses (cache_backend), entri juga disimpan di sana
+    dengan versi sebagai bagian kunci. `epoch` naik di setiap invalidasi lokal dan
+    dipakai pemanggil sebagai token baca (lihat cached_read).
+    """
+    def __init__(self, ttl=300, max_entries=256, backend=None):
+        self.ttl, self.max_entries = ttl, max_entries
+        self.backend = backend if backend is not None and backend.shared else None
+        self.version = self.epoch = 0
+        self.shared_ok = False # backend bersama dipakai hanya jika versi global sudah diketahui
+        self.changed_at = float('-inf')
+        self.hits = self.misses = self.evictions = self.shared_hits = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, version, key): return f"catalog:{version}:{key!r}"
+
+    def get(self, key):
+        with self._lock:
+            epoch, shared = self.epoch, self.shared_ok and self.backend is not None
+            item = self._data.get(key)
+            if item is not None and time.monotonic() - item[0] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, item[1]
+            if item is not None: del self._data[key]
+            shared_key = self._shared_key(self.version, key)
+        if shared:
+            try:
+                blob = self.backend.get(shared_key)
+            except Exception: # backend bersama mati: cukup pakai cache lokal
+                blob = None
+            if blob is not None:
+                value = pickle.loads(blob)
+                self._store(key, value, epoch)
+                with self._lock: self.shared_hits += 1
+                return True, value
+        with self._lock: self.misses += 1
+        return False, None
+
+    def _store(self, key, value, epoch):
+        with self._lock:
+            if epoch != self.epoch: return None # data dibaca sebelum ada penulisan baru
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return self._shared_key(self.version, key) if self.shared_ok and self.backend is not None else None
+
+    def set(self, key, value, epoch):
+        shared_key = self._store(key, value, epoch)
+        if shared_key is None: return
+        try:
+            self.backend.set(shared_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=int(self.ttl))
+        except Exception:
+            pass
+
+    def bump(self, version=None):
+        """Invalidasi. `version` dari sequence/NOTIFY diabaikan jika tidak lebih baru; tanpa
+        `version` (NOTIFY gagal) hanya cache lokal yang dibatalkan dan backend bersama tidak
+        dipakai sampai versi global berikutnya tiba."""
+        with self._lock:
+            if version is not None:
+                if version <= self.version:
+                    if version == self.version: self.shared_ok = True
+                    return
+                self.version, self.shared_ok = version, True
+            else:
+                self.shared_ok = False
+            self.epoch += 1
+            self.changed_at = time.monotonic()
+            self._data.clear()
+
+    def settled(self, lag):
+        """False selama `lag` detik setelah penulisan terakhir (replika mungkin belum menyusul)."""
+        return time.monotonic() - self.changed_at >= lag
+
+    def global_version(self):
+        """Versi katalog global (sequence), atau None jika belum diketahui proses ini."""
+        with self._lock: return self.version if self.shared_ok else None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'version': self.version, 'entries': len(self._data), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'shared_hits': self.shared_hits,
+                'backend': type(self.backend).__name__ if self.backend is not None else 'lokal',
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+@st.cache_resource
+def get_cache():
+    return CatalogCache(ttl=float(get_setting("CACHE_TTL", 300)),
+                        max_entries=int(get_setting("CACHE_MAX_ENTRIES", 256)),
+                        backend=cache_backend.get_backend())
+
+def get_cache_stats(): return get_cache().stats()
+
+CATALOG_CHANNEL = 'catalog_changed'
+
+def catalog_changed():
+    """Versi katalog baru dari sequence Postgres, disiarkan ke semua replika lewat NOTIFY."""
+    query = f"SELECT pg_notify('{CATALOG_CHANNEL}', v::text), v FROM (SELECT nextval('catalog_version') AS v) s"
+    try:
+        with metrics.track(query), get_connection() as conn:
+            with conn.cursor() as c:
+                c.execute(query)
+                version = c.fetchone()[1]
+            conn.commit()
+    except psycopg2.Error: # penulisan sudah tersimpan; minimal cache proses ini dibatalkan
+        get_cache().bump()
+        return
+    get_cache().bump(version)
+    if snapshot.enabled(): # snapshot versi baru disiapkan di belakang agar pembaca berikutnya tidak menunggu
+        schedule_snapshot()
+
+def _listen_catalog(cache):
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(get_setting("DATABASE_URL"))
+            conn.autocommit = True
+            with conn.cursor() as c:
+                c.execute(f"LISTEN {CATALOG_CHANNEL}")
+                # Notifikasi yang terlewat saat koneksi putus tertangkap dari nilai sequence
+                c.execute("SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM catalog_version")
+                cache.bump(c.fetchone()[0])
+            if snapshot.enabled(): schedule_snapshot(0) # snapshot versi saat ini saat proses mulai
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []): continue
+                conn.poll()
+                while conn.notifies:
+                    cache.bump(int(conn.notifies.pop(0).payload))
+                # Penulisan dari replika lain: snapshot host ini juga disusulkan
+                if snapshot.enabled(): schedule_snapshot()
+        except (psycopg2.Error, OSError, ValueError):
+            time.sleep(5)
+        finally:
+            if conn is not None and not conn.closed: conn.close()
+
+@st.cache_resource
+def start_catalog_listener():
+    """Satu thread LISTEN per proses: penulisan dari replika mana pun langsung membatalkan cache lokal."""
+    t = threading.Thread(target=_listen_catalog, args=(get_cache(),), daemon=True, name='catalog-listen')
+    t.start()
+    return t
+
+def cached_read(fn):
+    """Read-through cache untuk fungsi baca katalog. Hasil None (error) tidak disimpan."""
+    @functools.wraps(fn)
+    def wrapper(*args):
+        cache = get_cache()
+        key = (fn.__name__, args)
+        epoch = cache.epoch
+        hit, value = cache.get(key)
+        if not hit:
+            value = fn(*args)
+            if value is None: return None
+            # Dengan replika, hasil baca tepat setelah penulisan bisa basi, jadi belum disimpan
+            if get_replica() is None or cache.settled(get_db_settings().sticky_seconds):
+                cache.set(key, value, epoch)
+        # Pemanggil sering menambah kolom ke DataFrame, jadi kembalikan salinan
+        return value.copy() if hasattr(value, 'copy') else value
+    return wrapper
 
 def make_hashes(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
+    return security.hash_password(password)
 
 def check_hashes(password, hashed_text):
-    if make_hashes(password) == hashed_text:
-        return True
-    return False
+    return security.verify_password(password, hashed_text)[0]
 
-def init_db():
-    try:
-        conn = init_connection()
-        c = conn.cursor()
+# --- MIGRASI SKEMA ---
+
+# (versi, keterangan, daftar statement). Jangan ubah migrasi yang sudah rilis, tambahkan versi baru.
+# Statement boleh berupa fungsi(cursor) untuk langkah yang butuh parameter dari Python.
+MIGRATIONS = [
+    (1, "tabel dasar", [
+        '''CREATE TABLE IF NOT EXISTS recipes 
+           (id SERIAL PRIMARY KEY, name TEXT, source_link TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS ingredients 
+           (id SERIAL PRIMARY KEY, recipe_id INTEGER REFERENCES recipes(id), 
+            ingredient_name TEXT, quantity REAL, unit TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS users 
+           (username TEXT PRIMARY KEY, password TEXT, role TEXT)''',
+    ]),
+    (2, "index bahan per resep & nama bahan", [
+        "CREATE INDEX IF NOT EXISTS idx_ingredients_recipe_id ON ingredients (recipe_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ingredients_name ON ingredients (ingredient_name)",
+    ]),
+    (3, "hapus bahan otomatis saat resep dihapus", [
+        '''ALTER TABLE ingredients DROP CONSTRAINT IF EXISTS ingredients_recipe_id_fkey,
+           ADD CONSTRAINT ingredients_recipe_id_fkey FOREIGN KEY (recipe_id)
+           REFERENCES recipes(id) ON DELETE CASCADE''',
+    ]),
+    (4, "kunci nama bahan lowercase", [
+        '''ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS ingredient_key TEXT
+           GENERATED ALWAYS AS (lower(trim(ingredient_name))) STORED''',
+        "CREATE INDEX IF NOT EXISTS idx_ingredients_key ON ingredients (ingredient_key)",
+    ]),
+    (5, "index trigram untuk pencarian nama resep & username", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS idx_recipes_name_trgm ON recipes USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING gin (username gin_trgm_ops)",
+    ]),
+    (6, "rencana menu tersimpan + total bahan teragregasi", [
+        '''CREATE TABLE IF NOT EXISTS meal_plans 
+           (id SERIAL PRIMARY KEY, username TEXT REFERENCES users(username) ON DELETE CASCADE,
+            name TEXT, created_at TIMESTAMPTZ DEFAULT now())''',
+        '''CREATE TABLE IF NOT EXISTS meal_plan_items 
+           (id SERIAL PRIMARY KEY, plan_id INTEGER REFERENCES meal_plans(id) ON DELETE CASCADE,
+            recipe_id INTEGER REFERENCES recipes(id) ON DELETE CASCADE, portions REAL)''',
+        '''CREATE TABLE IF NOT EXISTS meal_plan_totals 
+           (plan_id INTEGER REFERENCES meal_plans(id) ON DELETE CASCADE, ingredient_name TEXT, unit TEXT,
+            total_quantity DOUBLE PRECISION, PRIMARY KEY (plan_id, ingredient_name, unit))''',
+        "CREATE INDEX IF NOT EXISTS idx_meal_plans_username ON meal_plans (username)",
+        "CREATE INDEX IF NOT EXISTS idx_meal_plan_items_plan ON meal_plan_items (plan_id)",
+        "CREATE INDEX IF NOT EXISTS idx_meal_plan_items_recipe ON meal_plan_items (recipe_id)",
+    ]),
+    (7, "katalog bahan & jumlah bahan per resep, diperbarui trigger", [
+        '''CREATE TABLE IF NOT EXISTS ingredient_catalog 
+           (ingredient_key TEXT PRIMARY KEY, display_name TEXT, usage_count INTEGER NOT NULL DEFAULT 0)''',
+        "CREATE INDEX IF NOT EXISTS idx_ingredient_catalog_usage ON ingredient_catalog (usage_count DESC, display_name)",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS ingredient_count INTEGER NOT NULL DEFAULT 0",
+        # Trigger per statement dengan transition table agar import massal tidak memicu trigger per baris
+        '''CREATE OR REPLACE FUNCTION ingredient_catalog_add() RETURNS trigger AS $$
+           BEGIN
+               INSERT INTO ingredient_catalog (ingredient_key, display_name, usage_count)
+               SELECT ingredient_key, min(ingredient_name), count(*) FROM new_rows
+               WHERE ingredient_key IS NOT NULL GROUP BY 1
+               ON CONFLICT (ingredient_key) DO UPDATE SET usage_count = ingredient_catalog.usage_count + EXCLUDED.usage_count;
+               UPDATE recipes r SET ingredient_count = (SELECT count(DISTINCT ingredient_key) FROM ingredients i WHERE i.recipe_id = r.id)
+               WHERE r.id IN (SELECT DISTINCT recipe_id FROM new_rows);
+               RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        '''CREATE OR REPLACE FUNCTION ingredient_catalog_remove() RETURNS trigger AS $$
+           BEGIN
+               UPDATE ingredient_catalog c SET usage_count = c.usage_count - d.n
+               FROM (SELECT ingredient_key, count(*) AS n FROM old_rows GROUP BY 1) d
+               WHERE c.ingredient_key = d.ingredient_key;
+               DELETE FROM ingredient_catalog WHERE usage_count <= 0
+                   AND ingredient_key IN (SELECT ingredient_key FROM old_rows);
+               UPDATE recipes r SET ingredient_count = (SELECT count(DISTINCT ingredient_key) FROM ingredients i WHERE i.recipe_id = r.id)
+               WHERE r.id IN (SELECT DISTINCT recipe_id FROM old_rows);
+               RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        '''CREATE OR REPLACE FUNCTION ingredient_catalog_change() RETURNS trigger AS $$
+           BEGIN
+               UPDATE ingredient_catalog c SET usage_count = c.usage_count - d.n
+               FROM (SELECT ingredient_key, count(*) AS n FROM old_rows GROUP BY 1) d
+               WHERE c.ingredient_key = d.ingredient_key;
+               INSERT INTO ingredient_catalog (ingredient_key, display_name, usage_count)
+               SELECT ingredient_key, min(ingredient_name), count(*) FROM new_rows
+               WHERE ingredient_key IS NOT NULL GROUP BY 1
+               ON CONFLICT (ingredient_key) DO UPDATE SET usage_count = ingredient_catalog.usage_count + EXCLUDED.usage_count;
+               DELETE FROM ingredient_catalog WHERE usage_count <= 0
+                   AND ingredient_key IN (SELECT ingredient_key FROM old_rows);
+               UPDATE recipes r SET ingredient_count = (SELECT count(DISTINCT ingredient_key) FROM ingredients i WHERE i.recipe_id = r.id)
+               WHERE r.id IN (SELECT recipe_id FROM old_rows UNION SELECT recipe_id FROM new_rows);
+               RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        "DROP TRIGGER IF EXISTS trg_ingredients_catalog_ins ON ingredients",
+        "DROP TRIGGER IF EXISTS trg_ingredients_catalog_del ON ingredients",
+        "DROP TRIGGER IF EXISTS trg_ingredients_catalog_upd ON ingredients",
+        '''CREATE TRIGGER trg_ingredients_catalog_ins AFTER INSERT ON ingredients
+           REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION ingredient_catalog_add()''',
+        '''CREATE TRIGGER trg_ingredients_catalog_del AFTER DELETE ON ingredients
+           REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION ingredient_catalog_remove()''',
+        '''CREATE TRIGGER trg_ingredients_catalog_upd AFTER UPDATE ON ingredients
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION ingredient_catalog_change()''',
+        # Isi awal dari data yang sudah ada
+        '''INSERT INTO ingredient_catalog (ingredient_key, display_name, usage_count)
+           SELECT ingredient_key, min(ingredient_name), count(*) FROM ingredients
+           WHERE ingredient_key IS NOT NULL GROUP BY 1 ON CONFLICT DO NOTHING''',
+        '''UPDATE recipes r SET ingredient_count = 
+           (SELECT count(DISTINCT ingredient_key) FROM ingredients i WHERE i.recipe_id = r.id)''',
+    ]),
+    (8, "harga & ukuran kemasan bahan", [
+        '''CREATE TABLE IF NOT EXISTS ingredient_prices 
+           (ingredient_key TEXT PRIMARY KEY, display_name TEXT NOT NULL,
+            pack_size DOUBLE PRECISION NOT NULL CHECK (pack_size > 0), pack_unit TEXT NOT NULL,
+            pack_price DOUBLE PRECISION NOT NULL CHECK (pack_price >= 0), updated_at TIMESTAMPTZ DEFAULT now())''',
+    ]),
+    (9, "versi katalog global untuk invalidasi cache antar replika", [
+        "CREATE SEQUENCE IF NOT EXISTS catalog_version",
+    ]),
+    (10, "total rencana per kunci bahan, satuan kosong tidak lagi NULL", [
+        "DROP TABLE IF EXISTS meal_plan_totals",
+        '''CREATE TABLE meal_plan_totals 
+           (plan_id INTEGER REFERENCES meal_plans(id) ON DELETE CASCADE, ingredient_key TEXT, ingredient_name TEXT,
+            unit TEXT, total_quantity DOUBLE PRECISION, PRIMARY KEY (plan_id, ingredient_key, unit))''',
+        lambda c: _apply_plan_delta(c, "TRUE", {}, 1), # total dihitung ulang dari item yang sudah ada
+    ]),
+    (11, "kunci bahan kanonik seperti fuzzy.canonical (spasi di dalam nama dirapikan)", [
+        "ALTER TABLE ingredients DROP COLUMN IF EXISTS ingredient_key",
+        r"""ALTER TABLE ingredients ADD COLUMN ingredient_key TEXT
+           GENERATED ALWAYS AS (btrim(regexp_replace(lower(ingredient_name), '\s+', ' ', 'g'))) STORED""",
+        "CREATE INDEX IF NOT EXISTS idx_ingredients_key ON ingredients (ingredient_key)",
+        "TRUNCATE ingredient_catalog",
+        """INSERT INTO ingredient_catalog (ingredient_key, display_name, usage_count)
+           SELECT ingredient_key, min(ingredient_name), count(*) FROM ingredients
+           WHERE ingredient_key IS NOT NULL GROUP BY 1""",
+        """UPDATE recipes r SET ingredient_count = 
+           (SELECT count(DISTINCT ingredient_key) FROM ingredients i WHERE i.recipe_id = r.id)""",
+        "TRUNCATE meal_plan_totals",
+        lambda c: _apply_plan_delta(c, "TRUE", {}, 1),
+        # Harga tersimpan dengan kunci aturan lama (strip + lower): varian yang kini satu kunci
+        # disisakan yang paling baru diperbarui, lalu kuncinya ditulis ulang
+        r"""DELETE FROM ingredient_prices p USING ingredient_prices q
+           WHERE btrim(regexp_replace(lower(p.ingredient_key), '\s+', ' ', 'g')) = btrim(regexp_replace(lower(q.ingredient_key), '\s+', ' ', 'g'))
+             AND (COALESCE(p.updated_at, '-infinity'), p.ingredient_key) < (COALESCE(q.updated_at, '-infinity'), q.ingredient_key)""",
+        r"""UPDATE ingredient_prices SET ingredient_key = btrim(regexp_replace(lower(ingredient_key), '\s+', ' ', 'g'))
+           WHERE ingredient_key <> btrim(regexp_replace(lower(ingredient_key), '\s+', ' ', 'g'))""",
+    ]),
+]
+
+MIGRATION_LOCK_ID = 72410501 # kunci advisory agar replika tidak migrasi bersamaan
+
+def run_migrations(c):
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations 
+                 (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMPTZ DEFAULT now())''')
+    c.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in c.fetchall()}
+    for version, desc, statements in MIGRATIONS:
+        if version in applied: continue
+        for stmt in statements: c.execute(stmt) if isinstance(stmt, str) else stmt(c)
+        c.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, desc))
+
+def seed_data(c):
+    c.execute("SELECT count(*) FROM users")
+    if c.fetchone()[0] == 0:
+        c.execute("INSERT INTO users VALUES (%s, %s, %s)", ('admin', make_hashes('admin123'), 'admin'))
+        c.execute("INSERT INTO users VALUES (%s, %s, %s)", ('user', make_hashes('user123'), 'user'))
         
-        # Tabel-tabel
-        c.execute('''CREATE TABLE IF NOT EXISTS recipes 
-                     (id SERIAL PRIMARY KEY, name TEXT, source_link TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS ingredients 
-                     (id SERIAL PRIMARY KEY, recipe_id INTEGER REFERENCES recipes(id), 
-                      ingredient_name TEXT, quantity REAL, unit TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS users 
-                     (username TEXT PRIMARY KEY, password TEXT, role TEXT)''')
+        # Seed Resep Dummy
+        c.execute("INSERT INTO recipes (name, source_link) VALUES (%s, %s) RETURNING id", 
+                  ('Nasi Goreng Spesial', 'https://www.youtube.com/watch?v=kY4tWz5vWwc'))
+        ns_id = c.fetchone()[0]
+        ingredients = [(ns_id, 'Nasi Putih', 200, 'gram'), (ns_id, 'Telur', 1, 'butir'), 
+                       (ns_id, 'Kecap Manis', 10, 'ml'), (ns_id, 'Bawang Merah', 3, 'siung')]
+        psycopg2.extras.execute_values(c, "INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit) VALUES %s", ingredients)
+
+@st.cache_resource
+def setup_database():
+    """Migrasi + seed, sekali per proses. Exception tidak di-cache sehingga dicoba lagi di rerun berikutnya."""
+    with get_connection() as conn:
+        c = conn.cursor()
+        run_migrations(c)
+        seed_data(c)
         conn.commit()
-        
-        # Seed Admin
-        c.execute("SELECT count(*) FROM users")
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO users VALUES (%s, %s, %s)", ('admin', make_hashes('admin123'), 'admin'))
-            c.execute("INSERT INTO users VALUES (%s, %s, %s)", ('user', make_hashes('user123'), 'user'))
-            
-            # Seed Resep Dummy
-            c.execute("INSERT INTO recipes (name, source_link) VALUES (%s, %s) RETURNING id", 
-                      ('Nasi Goreng Spesial', 'https://www.youtube.com/watch?v=kY4tWz5vWwc'))
-            ns_id = c.fetchone()[0]
-            ingredients = [(ns_id, 'Nasi Putih', 200, 'gram'), (ns_id, 'Telur', 1, 'butir'), 
-                           (ns_id, 'Kecap Manis', 10, 'ml'), (ns_id, 'Bawang Merah', 3, 'siung')]
-            for ing in ingredients:
-                c.execute("INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit) VALUES (%s, %s, %s, %s)", ing)
-            conn.commit()
-        
-        c.close(); conn.close()
+        c.close()
+    return True
+
+def init_db():
+    try:
+        setup_database()
+        start_catalog_listener()
     except Exception as e:
         st.error(f"DB Error: {e}")
 
 # --- FUNGSI CRUD (HELPER) ---
 
-def run_query(query, params=None, fetch_data=False):
-    conn = init_connection()
-    c = conn.cursor()
+def _timeout_sql(timeout_ms):
+    return f"SET LOCAL statement_timeout = {int(timeout_ms)}; " if timeout_ms else ""
+
+def _execute(query, params, fetch_data, timeout_ms, replica):
     data = None
+    with metrics.track(query) as m, get_connection(replica) as conn:
+        c = conn.cursor()
+        try:
+            # SET LOCAL dikirim bersama query (satu round trip) dan hanya berlaku di transaksi ini
+            sql = _timeout_sql(timeout_ms) + query
+            if params: c.execute(sql, params)
+            else: c.execute(sql)
+            
+            if fetch_data:
+                rows = c.fetchall()
+                build_start = time.perf_counter()
+                colnames = [desc[0] for desc in c.description]
+                data = pd.DataFrame(rows, columns=colnames)
+                m.rows, m.build_seconds = len(rows), time.perf_counter() - build_start
+            else:
+                conn.commit()
+                mark_write()
+                m.rows = max(c.rowcount, 0)
+        finally:
+            c.close()
+    return data
+
+def _iter_chunks(query, params, chunksize, timeout_ms, replica):
+    with metrics.track(query) as m, get_connection(replica) as conn:
+        if timeout_ms:
+            with conn.cursor() as c: c.execute(_timeout_sql(timeout_ms))
+        # Cursor bernama = cursor sisi server: baris dikirim per `chunksize`, tidak sekaligus
+        c = conn.cursor(name=f"chunks_{threading.get_ident()}_{time.monotonic_ns()}")
+        c.itersize = chunksize
+        try:
+            c.execute(query, params)
+            first = True
+            while True:
+                rows = c.fetchmany(chunksize)
+                if not rows and not first: break
+                build_start = time.perf_counter()
+                df = pd.DataFrame(rows, columns=[desc[0] for desc in c.description])
+                m.rows += len(rows)
+                m.build_seconds += time.perf_counter() - build_start
+                first = False
+                yield df
+                if len(rows) < chunksize: break
+        finally:
+            c.close()
+
+def run_query(query, params=None, fetch_data=False, timeout_ms=None, replica=False, chunksize=None):
+    """Jalankan satu query; error ditampilkan dengan st.error dan hasilnya None.
+
+    `timeout_ms` = statement_timeout panggilan ini (default DB_READ_TIMEOUT_MS untuk
+    baca, DB_WRITE_TIMEOUT_MS untuk tulis, 0 = tanpa batas). `replica=True` untuk
+    helper baca yang boleh dilayani replika; jika replika putus, diulang ke primary.
+
+    Dengan `chunksize`, hasil tidak dimuat sekaligus: yang dikembalikan adalah iterator
+    DataFrame berisi paling banyak `chunksize` baris (minimal satu, boleh kosong) dari
+    cursor sisi server. Koneksi dipegang sampai iterator habis/ditutup, dan error
+    diteruskan ke pemanggil saat iterasi.
+    """
+    if timeout_ms is None:
+        cfg = get_db_settings()
+        timeout_ms = cfg.read_timeout_ms if fetch_data else cfg.write_timeout_ms
+    if chunksize: return _iter_chunks(query, params, chunksize, timeout_ms, replica)
     try:
-        if params: c.execute(query, params)
-        else: c.execute(query)
-        
-        if fetch_data:
-            colnames = [desc[0] for desc in c.description]
-            data = pd.DataFrame(c.fetchall(), columns=colnames)
-        else:
-            conn.commit()
+        try:
+            return _execute(query, params, fetch_data, timeout_ms, replica)
+        except psycopg2.OperationalError as e:
+            if not replica or isinstance(e, psycopg2.extensions.QueryCanceledError): raise
+            return _execute(query, params, fetch_data, timeout_ms, False)
     except Exception as e:
         st.error(f"Error: {e}")
-    finally:
-        c.close(); conn.close()
-    return data
+    return None
+
+# --- TRANSAKSI (UNIT OF WORK) ---
+
+class UnitOfWork:
+    """Cursor dalam satu transaksi. Statement sejenis dikirim per batch lewat execute_batch."""
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.catalog_dirty = False
+
+    def execute(self, query, params=None, catalog=True):
+        self.cursor.execute(query, params)
+        self.catalog_dirty |= catalog
+        return self.cursor.rowcount
+
+    def fetchall(self, query, params=None, catalog=True):
+        self.cursor.execute(query, params)
+        self.catalog_dirty |= catalog
+        return self.cursor.fetchall()
+
+    def execute_batch(self, query, seq, catalog=True, page_size=100):
+        seq = list(seq)
+        if not seq: return 0
+        psycopg2.extras.execute_batch(self.cursor, query, seq, page_size=page_size)
+        self.catalog_dirty |= catalog
+        return len(seq)
+
+@contextmanager
+def transaction(timeout_ms=None):
+    """Satu koneksi, satu commit; rollback otomatis jika terjadi exception.
+
+        with transaction() as tx:
+            tx.execute("DELETE ...", (...))
+            tx.execute_batch("UPDATE ...", rows)
+
+    `timeout_ms` berlaku per statement (default DB_WRITE_TIMEOUT_MS).
+    """
+    timeout_ms = get_db_settings().write_timeout_ms if timeout_ms is None else timeout_ms
+    with metrics.track('TRANSACTION'), get_connection() as conn:
+        c = conn.cursor()
+        uow = UnitOfWork(c)
+        try:
+            if timeout_ms: c.execute(_timeout_sql(timeout_ms))
+            yield uow
+            conn.commit()
+            mark_write()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            c.close()
+    if uow.catalog_dirty: catalog_changed()
 
 # --- FUNGSI USER ---
 def login_user(username, password):
-    conn = init_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = %s', (username,))
-    data = c.fetchone()
-    conn.close()
-    if data and check_hashes(password, data[1]): return data
-    return None
+    data = get_user_by_username(username)
+    if not data: return None
+    # Verifikasi (mahal) dijalankan di worker pool terbatas
+    ok, needs_rehash = security.verify_password_async(password, data[1]).result()
+    if not ok: return None
+    if needs_rehash: # hash lama (SHA-256) diganti otomatis saat login berhasil
+        run_query("UPDATE users SET password=%s WHERE username=%s",
+                  (security.hash_password_async(password).result(), username))
+    return data
 # --- TAMBAHKAN INI DI FILE database.py (Di bawah fungsi login_user) ---
 def get_user_by_username(username):
-    conn = init_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = %s', (username,))
-    data = c.fetchone()
-    conn.close()
+    query = 'SELECT * FROM users WHERE username = %s'
+    with metrics.track(query) as m, get_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, (username,))
+        data = c.fetchone()
+        m.rows = int(data is not None)
+        c.close()
     return data
 def create_user(u, p, r): return run_query("INSERT INTO users VALUES (%s, %s, %s)", (u, make_hashes(p), r))
 def update_user(u, p, r):
@@ -97,44 +742,515 @@ def update_user(u, p, r):
 def delete_user_data(u): run_query("DELETE FROM users WHERE username=%s", (u,))
 def get_all_users(): return run_query("SELECT username, role FROM users", fetch_data=True)
 
+def search_users(term='', after=None, limit=50):
+    """Satu halaman user (keyset by username). Return (DataFrame, cursor berikutnya atau None)."""
+    term = term.strip()
+    df = run_query('''SELECT username, role FROM users
+                      WHERE (%(term)s = '' OR username ILIKE %(like)s)
+                        AND (%(after)s::text IS NULL OR username > %(after)s)
+                      ORDER BY username LIMIT %(limit)s''',
+                   {'term': term, 'like': f"%{_escape_like(term)}%", 'after': after, 'limit': limit + 1}, fetch_data=True,
+                   timeout_ms=get_db_settings().search_timeout_ms, replica=True)
+    return _page(df, limit, 'username')
+
 # --- FUNGSI RESEP ---
-def get_all_recipes(): return run_query("SELECT * FROM recipes ORDER BY id", fetch_data=True)
-def add_recipe_to_db(n, l): run_query("INSERT INTO recipes (name, source_link) VALUES (%s, %s)", (n, l))
-def update_recipe_data(id, n, l): run_query("UPDATE recipes SET name=%s, source_link=%s WHERE id=%s", (n, l, id))
+def _escape_like(term): return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _page(df, limit, key):
+    if df is None: return None, None
+    if len(df) > limit: return df.iloc[:limit], df[key].iloc[limit - 1]
+    return df, None
+
+def search_recipes(term='', after_id=None, limit=50):
+    """Satu halaman resep (keyset by id) dengan filter nama.
+
+    Cocok jika nama diawali / mengandung `term`, atau mirip secara trigram (salah ketik).
+    Return (DataFrame, cursor berikutnya atau None).
+    """
+    term = term.strip()
+    df = run_query('''SELECT id, name, source_link FROM recipes
+                      WHERE (%(term)s = '' OR name ILIKE %(like)s OR name %% %(term)s)
+                        AND (%(after)s::int IS NULL OR id > %(after)s)
+                      ORDER BY id LIMIT %(limit)s''',
+                   {'term': term, 'like': f"%{_escape_like(term)}%",
+                    'after': None if after_id is None else int(after_id), 'limit': limit + 1}, fetch_data=True,
+                   timeout_ms=get_db_settings().search_timeout_ms, replica=True)
+    return _page(df, limit, 'id')
+
+@cached_read
+def get_all_recipes(): return run_query("SELECT * FROM recipes ORDER BY id", fetch_data=True, replica=True)
+def add_recipe_to_db(n, l):
+    run_query("INSERT INTO recipes (name, source_link) VALUES (%s, %s)", (n, l))
+    catalog_changed()
+def update_recipe_data(id, n, l):
+    run_query("UPDATE recipes SET name=%s, source_link=%s WHERE id=%s", (n, l, id))
+    catalog_changed()
 def delete_recipe_from_db(id):
-    run_query("DELETE FROM ingredients WHERE recipe_id=%s", (id,))
-    run_query("DELETE FROM recipes WHERE id=%s", (id,))
+    try:
+        with transaction() as tx:
+            plans = [r[0] for r in tx.fetchall("SELECT DISTINCT plan_id FROM meal_plan_items WHERE recipe_id=%s", (id,))]
+            # Bahan juga terhapus lewat ON DELETE CASCADE; dihapus eksplisit agar tetap atomik di skema lama
+            tx.execute("DELETE FROM ingredients WHERE recipe_id=%s", (id,))
+            tx.execute("DELETE FROM recipes WHERE id=%s", (id,))
+            refresh_plan_totals(tx.cursor, plans)
+    except Exception as e:
+        st.error(f"Error: {e}")
 
 # --- FUNGSI BAHAN ---
-def get_ingredients_by_recipe(id): return run_query("SELECT id, ingredient_name, quantity, unit FROM ingredients WHERE recipe_id=%s ORDER BY id", (int(id),), fetch_data=True)
-def add_ingredient_to_db(id, n, q, u): run_query("INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit) VALUES (%s, %s, %s, %s)", (id, n, q, u))
-def update_ingredient_data(id, n, q, u): run_query("UPDATE ingredients SET ingredient_name=%s, quantity=%s, unit=%s WHERE id=%s", (n, q, u, id))
-def delete_ingredient_data(id): run_query("DELETE FROM ingredients WHERE id=%s", (id,))
+def get_ingredients_by_recipe(id): return _get_ingredients_by_recipe(int(id))
+@cached_read
+def _get_ingredients_by_recipe(id): return run_query("SELECT id, ingredient_name, quantity, unit FROM ingredients WHERE recipe_id=%s ORDER BY id", (id,), fetch_data=True, replica=True)
+def _write_ingredient(query, params):
+    # Bahan resep berubah -> total rencana menu yang memuat resep itu ikut dihitung ulang
+    try:
+        with transaction() as tx:
+            rows = tx.fetchall(query + " RETURNING recipe_id", params)
+            refresh_plans_for_recipes(tx.cursor, [r[0] for r in rows])
+    except Exception as e:
+        st.error(f"Error: {e}")
+def add_ingredient_to_db(id, n, q, u): _write_ingredient("INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit) VALUES (%s, %s, %s, %s)", (id, n, q, u))
+def update_ingredient_data(id, n, q, u): _write_ingredient("UPDATE ingredients SET ingredient_name=%s, quantity=%s, unit=%s WHERE id=%s", (n, q, u, id))
+def delete_ingredient_data(id): _write_ingredient("DELETE FROM ingredients WHERE id=%s", (id,))
+
+def save_recipe_ingredients(recipe_id, original, edited):
+    """Terapkan semua perubahan tabel bahan (hasil st.data_editor) dalam satu transaksi.
+
+    Return jumlah {'inserted', 'updated', 'deleted'}, atau None jika gagal.
+    """
+    inserts, updates, deletes = utils.diff_ingredient_rows(original, edited)
+    try:
+        with transaction() as tx:
+            if deletes: tx.execute("DELETE FROM ingredients WHERE recipe_id=%s AND id = ANY(%s)", (int(recipe_id), deletes))
+            tx.execute_batch("UPDATE ingredients SET ingredient_name=%s, quantity=%s, unit=%s WHERE id=%s", updates)
+            tx.execute_batch("INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit) VALUES (%s, %s, %s, %s)",
+                             [(int(recipe_id),) + row for row in inserts])
+            refresh_plans_for_recipes(tx.cursor, [int(recipe_id)])
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+def _unit_params():
+    aliases = list(utils.UNIT_RULES)
+    bases = [utils.UNIT_RULES[a][0] for a in aliases]
+    factors = [float(utils.UNIT_RULES[a][1]) for a in aliases]
+    return (aliases, bases, factors)
+
+def _density_params():
+    keys = list(utils.INGREDIENT_DENSITY)
+    return (keys, [float(utils.INGREDIENT_DENSITY[k]) for k in keys])
+
+def _menu_params(menu):
+    ids = [int(r) for r, _ in menu]
+    portions = [float(p) for _, p in menu]
+    return (ids, portions) + _unit_params() + _density_params()
+
+# Satuan dasar baris bahan `i` (alias `r`). Satuan kosong/NULL dijumlahkan sebagai '' agar
+# tetap bisa menjadi bagian primary key meal_plan_totals.
+_UNIT_SQL = "COALESCE(r.base, lower(trim(i.unit)), '')"
+
+_MENU_JOIN = '''
+        FROM unnest(%s::int[], %s::float8[]) AS m(recipe_id, portions)
+        JOIN ingredients i ON i.recipe_id = m.recipe_id
+        LEFT JOIN unnest(%s::text[], %s::text[], %s::float8[]) AS r(alias, base, factor)
+               ON r.alias = lower(trim(i.unit))
+        LEFT JOIN unnest(%s::text[], %s::float8[]) AS d(key, density) ON d.key = i.ingredient_key'''
+
+def _merge_units(rows, extra=(), per=None):
+    """Jumlahkan baris bahan `rows` (kolom ingredient_key, ingredient_name, unit, qty, density, `extra`)
+    per bahan & satuan, dikelompokkan per ingredient_key (nama kanonik).
+
+    Seperti utils.normalize_units: baris ml diubah ke gram dengan massa jenisnya jika bahan yang
+    sama juga muncul dalam gram di kelompok kolom `per` (default `extra`).
+    """
+    cols = ''.join(f"{c}, " for c in extra)
+    part = ', '.join(list(extra if per is None else per) + ['ingredient_key'])
+    return f'''
+        SELECT {cols}min(ingredient_name) AS ingredient_name, unit, SUM(qty) AS total_quantity FROM (
+            SELECT {cols}ingredient_key, ingredient_name,
+                   CASE WHEN to_mass THEN 'gram' ELSE unit END AS unit,
+                   CASE WHEN to_mass THEN qty * density ELSE qty END AS qty
+            FROM (SELECT t.*, t.unit = 'ml' AND t.density IS NOT NULL
+                              AND bool_or(t.unit = 'gram') OVER (PARTITION BY {part}) AS to_mass
+                  FROM ({rows}) t) w) x
+        GROUP BY {cols}ingredient_key, unit ORDER BY {cols}ingredient_name, unit'''
+
+_MENU_ROWS = '''
+        SELECT i.ingredient_key, i.ingredient_name, ''' + _UNIT_SQL + ''' AS unit, d.density,
+               i.quantity * m.portions * COALESCE(r.factor, 1) AS qty'''
+
+_SHOPPING_SQL = _merge_units(_MENU_ROWS + _MENU_JOIN + " WHERE i.ingredient_key IS NOT NULL")
+
+def get_shopping_list(menu):
+    """Total bahan untuk seluruh menu [(recipe_id, porsi), ...] dalam satu query.
+
+    Konversi satuan (utils.UNIT_RULES, utils.INGREDIENT_DENSITY) dan SUM dikerjakan di Postgres.
+    """
+    if not menu: return pd.DataFrame(columns=['ingredient_name', 'unit', 'total_quantity'])
+    return run_query(_SHOPPING_SQL, _menu_params(menu), fetch_data=True, replica=True)
+
+@cached_read
+def get_shopping_breakdown(menu):
+    """Rincian kebutuhan bahan per resep untuk menu (tuple of (recipe_id, porsi))."""
+    if not menu: return pd.DataFrame(columns=['recipe_name', 'ingredient_name', 'unit', 'total_quantity'])
+    # Konversi ml -> gram diputuskan per menu (bukan per resep) agar rinciannya cocok dengan total belanja
+    rows = _MENU_ROWS + ", rc.name AS recipe_name" + _MENU_JOIN + '''
+        JOIN recipes rc ON rc.id = m.recipe_id WHERE i.ingredient_key IS NOT NULL'''
+    return run_query(_merge_units(rows, extra=('recipe_name',), per=()), _menu_params(menu), fetch_data=True, replica=True)
+
+# --- IMPORT / EXPORT MASSAL ---
+
+BULK_COLUMNS = ['recipe_name', 'source_link', 'ingredient_name', 'quantity', 'unit']
+
+def bulk_import_recipes(df):
+    """Import resep format panjang (satu baris per bahan, kolom BULK_COLUMNS) dalam satu transaksi.
+
+    Data di-COPY ke tabel staging lalu di-upsert: resep dicocokkan berdasarkan nama,
+    bahan milik resep yang diimport diganti seluruhnya. Exception diteruskan ke pemanggil.
+    """
+    start = time.perf_counter()
+    buf = StringIO()
+    df[BULK_COLUMNS].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    with get_connection() as conn:
+        c = conn.cursor()
+        try:
+            c.execute('''CREATE TEMP TABLE recipe_stage 
+                         (recipe_name TEXT, source_link TEXT, ingredient_name TEXT, quantity REAL, unit TEXT)
+                         ON COMMIT DROP''')
+            c.copy_expert("COPY recipe_stage FROM STDIN WITH (FORMAT csv)", buf)
+            c.execute('''CREATE TEMP TABLE recipe_map ON COMMIT DROP AS
+                         SELECT s.recipe_name, max(s.source_link) AS source_link, min(r.id) AS id
+                         FROM recipe_stage s LEFT JOIN recipes r ON r.name = s.recipe_name
+                         WHERE s.recipe_name IS NOT NULL GROUP BY s.recipe_name''')
+            c.execute('''UPDATE recipes r SET source_link = COALESCE(m.source_link, r.source_link)
+                         FROM recipe_map m WHERE r.id = m.id''')
+            updated = c.rowcount
+            c.execute('''WITH ins AS (INSERT INTO recipes (name, source_link)
+                                      SELECT recipe_name, source_link FROM recipe_map WHERE id IS NULL
+                                      RETURNING id, name)
+                         UPDATE recipe_map m SET id = ins.id FROM ins
+                         WHERE m.recipe_name = ins.name AND m.id IS NULL''')
+            inserted = c.rowcount
+            c.execute("DELETE FROM ingredients i USING recipe_map m WHERE i.recipe_id = m.id")
+            c.execute('''INSERT INTO ingredients (recipe_id, ingredient_name, quantity, unit)
+                         SELECT m.id, s.ingredient_name, s.quantity, s.unit
+                         FROM recipe_stage s JOIN recipe_map m USING (recipe_name)
+                         WHERE s.ingredient_name IS NOT NULL AND trim(s.ingredient_name) <> ''
+                      ''')
+            ing_count = c.rowcount
+            c.execute("SELECT id FROM recipe_map")
+            refresh_plans_for_recipes(c, [r[0] for r in c.fetchall()])
+            conn.commit()
+            mark_write()
+        finally:
+            c.close()
+    catalog_changed()
+    seconds = time.perf_counter() - start
+    return {'rows': len(df), 'recipes_new': inserted, 'recipes_updated': updated,
+            'ingredients': ing_count, 'seconds': seconds, 'rows_per_sec': len(df) / seconds if seconds else 0.0}
+
+def bulk_export_recipes():
+    """Seluruh katalog sebagai CSV (format yang sama dengan bulk_import_recipes) via COPY TO STDOUT."""
+    start = time.perf_counter()
+    buf = BytesIO()
+    with get_connection(replica=True) as conn:
+        c = conn.cursor()
+        try:
+            c.copy_expert('''COPY (SELECT r.name AS recipe_name, r.source_link, i.ingredient_name, i.quantity, i.unit
+                                FROM recipes r LEFT JOIN ingredients i ON i.recipe_id = r.id
+                                ORDER BY r.id, i.id)
+                             TO STDOUT WITH (FORMAT csv, HEADER)''', buf)
+            rows = c.rowcount
+        finally:
+            c.close()
+    seconds = time.perf_counter() - start
+    return buf.getvalue(), {'rows': rows, 'seconds': seconds, 'rows_per_sec': rows / seconds if seconds else 0.0}
+
+# --- RENCANA MENU TERSIMPAN ---
+
+# Tambah (sign=1) / kurangi (sign=-1) kontribusi item rencana ke total bahan rencananya
+_PLAN_DELTA_SQL = '''
+    INSERT INTO meal_plan_totals (plan_id, ingredient_key, ingredient_name, unit, total_quantity)
+    SELECT p.plan_id, i.ingredient_key, min(i.ingredient_name), ''' + _UNIT_SQL + ''',
+           %(sign)s * SUM(i.quantity * p.portions * COALESCE(r.factor, 1))
+    FROM meal_plan_items p
+    JOIN ingredients i ON i.recipe_id = p.recipe_id
+    LEFT JOIN unnest(%(aliases)s::text[], %(bases)s::text[], %(factors)s::float8[]) AS r(alias, base, factor)
+           ON r.alias = lower(trim(i.unit))
+    WHERE ({where}) AND i.ingredient_key IS NOT NULL
+    GROUP BY 1, 2, 4
+    ON CONFLICT (plan_id, ingredient_key, unit)
+    DO UPDATE SET total_quantity = meal_plan_totals.total_quantity + EXCLUDED.total_quantity'''
+
+def _apply_plan_delta(c, where, params, sign):
+    aliases, bases, factors = _unit_params()
+    c.execute(_PLAN_DELTA_SQL.format(where=where),
+              dict(params, sign=sign, aliases=aliases, bases=bases, factors=factors))
+    # Bahan yang totalnya habis (sisa pembulatan float) dibuang
+    c.execute(f'''DELETE FROM meal_plan_totals WHERE abs(total_quantity) < 1e-6
+                  AND plan_id IN (SELECT p.plan_id FROM meal_plan_items p WHERE {where})''', params)
+
+def refresh_plan_totals(c, plan_ids):
+    """Hitung ulang penuh total rencana tertentu (dipakai jika bahan resepnya berubah)."""
+    if not plan_ids: return
+    c.execute("DELETE FROM meal_plan_totals WHERE plan_id = ANY(%s)", (list(plan_ids),))
+    _apply_plan_delta(c, "p.plan_id = ANY(%(plans)s)", {'plans': list(plan_ids)}, 1)
+
+def refresh_plans_for_recipes(c, recipe_ids):
+    if not recipe_ids: return
+    c.execute("SELECT DISTINCT plan_id FROM meal_plan_items WHERE recipe_id = ANY(%s)", (list(recipe_ids),))
+    refresh_plan_totals(c, [r[0] for r in c.fetchall()])
+
+def get_user_plans(username):
+    return run_query('''SELECT p.id, p.name, count(i.id) AS dishes, COALESCE(SUM(i.portions), 0) AS portions
+                         FROM meal_plans p LEFT JOIN meal_plan_items i ON i.plan_id = p.id
+                         WHERE p.username=%s GROUP BY p.id ORDER BY p.id''', (username,), fetch_data=True)
+def create_plan(username, name):
+    """Return id rencana baru, atau None jika gagal (error ditampilkan dengan st.error)."""
+    try:
+        with transaction() as tx:
+            return tx.fetchall("INSERT INTO meal_plans (username, name) VALUES (%s, %s) RETURNING id", (username, name), catalog=False)[0][0]
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+def delete_plan(plan_id): run_query("DELETE FROM meal_plans WHERE id=%s", (plan_id,))
+
+def get_plan_items(plan_id):
+    return run_query('''SELECT p.id AS item_id, p.recipe_id AS id, r.name, p.portions, r.source_link AS link
+                         FROM meal_plan_items p JOIN recipes r ON r.id = p.recipe_id
+                         WHERE p.plan_id=%s ORDER BY p.id''', (plan_id,), fetch_data=True)
+
+# Total tersimpan per satuan dasar; konversi massa jenis diterapkan saat dibaca karena
+# bergantung pada isi seluruh rencana, bukan satu item
+_PLAN_ROWS = '''
+        SELECT t.plan_id, t.ingredient_key, t.ingredient_name, t.unit, t.total_quantity AS qty, d.density
+        FROM meal_plan_totals t
+        LEFT JOIN unnest(%(dkeys)s::text[], %(dvalues)s::float8[]) AS d(key, density) ON d.key = t.ingredient_key
+        WHERE t.plan_id = ANY(%(plans)s)'''
+_PLAN_TOTALS_SQL = _merge_units(_PLAN_ROWS)
+
+def _plan_params(plan_ids):
+    dkeys, dvalues = _density_params()
+    return {'plans': [int(p) for p in plan_ids], 'dkeys': dkeys, 'dvalues': dvalues}
+
+def get_plan_totals(plan_id):
+    """Total bahan rencana yang sudah teragregasi, siap ditampilkan tanpa dihitung ulang."""
+    return run_query(_PLAN_TOTALS_SQL, _plan_params([plan_id]), fetch_data=True)
+
+def add_plan_item(plan_id, recipe_id, portions):
+    """Tambah masakan ke rencana; total bahan diperbarui sebesar kontribusi masakan ini saja.
+
+    Return id item baru, atau None jika gagal.
+    """
+    try:
+        with transaction() as tx:
+            item_id = tx.fetchall("INSERT INTO meal_plan_items (plan_id, recipe_id, portions) VALUES (%s, %s, %s) RETURNING id",
+                                  (int(plan_id), int(recipe_id), float(portions)), catalog=False)[0][0]
+            _apply_plan_delta(tx.cursor, "p.id = %(item)s", {'item': item_id}, 1)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+    return item_id
+
+def remove_plan_item(item_id):
+    """Return True jika berhasil, None jika gagal."""
+    try:
+        with transaction() as tx:
+            _apply_plan_delta(tx.cursor, "p.id = %(item)s", {'item': int(item_id)}, -1)
+            tx.execute("DELETE FROM meal_plan_items WHERE id=%s", (int(item_id),), catalog=False)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+    return True
+
+def clear_plan(plan_id):
+    """Return True jika berhasil, None jika gagal."""
+    try:
+        with transaction() as tx:
+            tx.execute("DELETE FROM meal_plan_items WHERE plan_id=%s", (int(plan_id),), catalog=False)
+            tx.execute("DELETE FROM meal_plan_totals WHERE plan_id=%s", (int(plan_id),), catalog=False)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+    return True
+
+def get_plans_totals(plan_ids):
+    """Total bahan beberapa rencana sekaligus (kolom plan_id, ingredient_name, unit, total_quantity)."""
+    return run_query(_merge_units(_PLAN_ROWS, extra=('plan_id',)), _plan_params(plan_ids), fetch_data=True)
+
+# --- HARGA BAHAN ---
+@cached_read
+def get_ingredient_prices():
+    return run_query(f"SELECT {', '.join(utils.PRICE_COLUMNS)} FROM ingredient_prices ORDER BY display_name", fetch_data=True, replica=True)
+
+def save_ingredient_prices(original, edited):
+    """Simpan tabel harga hasil st.data_editor dalam satu transaksi: baris baru/berubah di-upsert,
+    baris yang dihapus dari tabel ikut dihapus. Return {'saved', 'deleted'}, atau None jika gagal.
+    """
+    cols = ['display_name', 'pack_size', 'pack_unit', 'pack_price']
+    rows = edited.dropna(subset=cols)
+    rows = rows[rows['display_name'].astype(str).str.strip() != '']
+    rows = rows.assign(ingredient_key=utils.ingredient_key(rows['display_name'])).drop_duplicates('ingredient_key', keep='last')
+    deleted = sorted(set(original['ingredient_key'].dropna()) - set(rows['ingredient_key']))
+    
+    new = rows.set_index('ingredient_key')[cols]
+    old = original.dropna(subset=['ingredient_key']).set_index('ingredient_key')[cols].reindex(new.index)
+    changed = ((new != old) & ~(new.isna() & old.isna())).any(axis=1)
+    upserts = [(k,) + row for k, row in zip(new.index[changed], new[changed].itertuples(index=False, name=None))]
+    try:
+        with transaction() as tx:
+            if deleted: tx.execute("DELETE FROM ingredient_prices WHERE ingredient_key = ANY(%s)", (deleted,))
+            tx.execute_batch('''INSERT INTO ingredient_prices (ingredient_key, display_name, pack_size, pack_unit, pack_price)
+                                VALUES (%s, %s, %s, %s, %s)
+                                ON CONFLICT (ingredient_key) DO UPDATE SET display_name = EXCLUDED.display_name,
+                                    pack_size = EXCLUDED.pack_size, pack_unit = EXCLUDED.pack_unit,
+                                    pack_price = EXCLUDED.pack_price, updated_at = now()''', upserts)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return None
+    return {'saved': len(upserts), 'deleted': len(deleted)}
 
 # --- FUNGSI SEARCH ---
 def get_all_unique_ingredients():
-    df = run_query("SELECT DISTINCT ingredient_name FROM ingredients ORDER BY ingredient_name", fetch_data=True)
-    return df['ingredient_name'].tolist() if df is not None else []
+    """Nama bahan dari katalog (tabel ingredient_catalog), urut dari yang paling sering dipakai."""
+    ings = _get_all_unique_ingredients()
+    return ings if ings is not None else []
+@cached_read
+def _get_all_unique_ingredients():
+    df = run_query("SELECT display_name FROM ingredient_catalog ORDER BY usage_count DESC, display_name", fetch_data=True, replica=True)
+    return df['display_name'].tolist() if df is not None else None
+
+@cached_read
+def get_ingredient_catalog():
+    return run_query("SELECT ingredient_key, display_name, usage_count FROM ingredient_catalog ORDER BY usage_count DESC, display_name",
+                     fetch_data=True, replica=True)
+
+class RecipeIndex:
+    """Inverted index bahan -> resep untuk pencarian resep dari stok.
+
+    Hanya resep yang punya minimal satu bahan yang dipilih yang dihitung skornya.
+    Bahan dicocokkan lewat identitas kanonik (fuzzy.canonical) dan nama yang salah
+    ketik dipetakan ke bahan terdekat lewat index trigram. Jumlah bahan per resep
+    diambil dari kolom recipes.ingredient_count (dijaga trigger) jika tersedia.
+    """
+    def __init__(self, recipes, ings):
+        self.meta = {}
+        self.sizes = {}
+        if recipes is not None:
+            for rid, name, link in zip(recipes['id'], recipes['name'], recipes['source_link']):
+                self.meta[int(rid)] = (name, link)
+            if 'ingredient_count' in recipes:
+                self.sizes = {int(rid): int(n) for rid, n in zip(recipes['id'], recipes['ingredient_count']) if n}
+        self.recipe_ings = defaultdict(set)
+        self.postings = defaultdict(set)
+        self.display = {}
+        if ings is not None:
+            for rid, name in zip(ings['recipe_id'], ings['ingredient_name']):
+                key = fuzzy.canonical(name)
+                self.recipe_ings[int(rid)].add(key)
+                self.postings[key].add(int(rid))
+                self.display.setdefault(key, name)
+        for rid, r_set in self.recipe_ings.items(): self.sizes.setdefault(rid, len(r_set))
+        self.names = fuzzy.TrigramIndex(list(self.postings), {k: len(v) for k, v in self.postings.items()})
+
+    def suggest(self, query, limit=20):
+        return [self.display[k] for k in self.names.suggest(query, limit)]
 
-def find_matching_recipes(user_ingredients):
+    def search(self, user_ingredients, top_k=None):
+        user_set = set([self.names.resolve(x) for x in user_ingredients])
+        common = Counter()
+        for ing in user_set:
+            common.update(self.postings.get(ing, ()))
+        
+        def build(rid):
+            r_set = self.recipe_ings[rid]
+            name, link = self.meta[rid]
+            missing = r_set - user_set
+            return {
+                'id': rid, 'name': name, 'source_link': link,
+                'match_score': common[rid] / self.sizes[rid] * 100, 'missing_count': len(missing),
+                'missing_ingredients': list(missing)
+            }
+        
+        # Urutan id dijaga agar hasil yang skornya sama tetap berurutan seperti sebelumnya
+        cands = sorted(rid for rid in common if rid in self.meta)
+        score = lambda rid: common[rid] / self.sizes[rid]
+        if top_k is not None:
+            cands = heapq.nlargest(top_k, cands, key=score)
+        else:
+            cands = sorted(cands, key=score, reverse=True)
+        return [build(rid) for rid in cands]
+
+@cached_read
+def get_recipe_index():
+    snap = get_snapshot()
+    if snap is not None:
+        return RecipeIndex(snap['recipes'].select(['id', 'name', 'source_link', 'ingredient_count']).to_pandas(),
+                           snap['ingredients'].select(['recipe_id', 'ingredient_name']).to_pandas())
     recipes = get_all_recipes()
-    all_ings = run_query("SELECT recipe_id, ingredient_name FROM ingredients", fetch_data=True)
-    results = []
-    user_set = set([x.lower() for x in user_ingredients])
-    
-    if recipes is not None:
-        for _, r in recipes.iterrows():
-            r_ings = all_ings[all_ings['recipe_id'] == r['id']]['ingredient_name'].tolist()
-            r_set = set([x.lower() for x in r_ings])
-            if not r_set: continue
-            
-            common = user_set.intersection(r_set)
-            score = len(common) / len(r_set) * 100
-            if score > 0:
-                results.append({
-                    'id': r['id'], 'name': r['name'], 'source_link': r['source_link'],
-                    'match_score': score, 'missing_count': len(r_set - user_set),
-                    'missing_ingredients': list(r_set - user_set)
-                })
-        results.sort(key=lambda x: x['match_score'], reverse=True)
-    return results
+    all_ings = run_query("SELECT recipe_id, ingredient_name FROM ingredients", fetch_data=True, replica=True)
+    if recipes is None or all_ings is None: return None
+    return RecipeIndex(recipes, all_ings)
+
+# --- SNAPSHOT KOLUMNAR ---
+def get_snapshot():
+    """Tabel Arrow katalog (snapshot.py) untuk versi global saat ini. None jika snapshot nonaktif,
+    versi belum diketahui, atau file versi ini belum siap: pembaca memakai database, snapshot
+    hanya dibangun di latar oleh schedule_snapshot."""
+    if not snapshot.enabled(): return None
+    version = get_cache().global_version()
+    if version is None: return None
+    try:
+        return snapshot.load(version)
+    except (OSError, snapshot.pa.ArrowException):
+        return None
+
+def _build_snapshot():
+    version = get_cache().global_version()
+    if version is None or get_snapshot() is not None: return
+    chunk = int(get_setting("SNAPSHOT_CHUNK_ROWS", 50000))
+    try:
+        snapshot.build(version, lambda q: run_query(q, fetch_data=True, timeout_ms=0, chunksize=chunk))
+    except (psycopg2.Error, OSError, snapshot.pa.ArrowException):
+        pass
+
+_snapshot_state = {'scheduled': False}
+_snapshot_lock = threading.Lock()
+_snapshot_build = threading.Lock()
+
+def schedule_snapshot(delay=None):
+    """Bangun ulang snapshot di thread latar, ditunda `delay` detik (default SNAPSHOT_DELAY). Serangkaian
+    penulisan dalam jeda itu hanya memicu satu build (untuk versi terbaru), dan build tidak berjalan bersamaan."""
+    with _snapshot_lock:
+        if _snapshot_state['scheduled']: return
+        _snapshot_state['scheduled'] = True
+    def run():
+        time.sleep(float(get_setting("SNAPSHOT_DELAY", 5)) if delay is None else delay)
+        with _snapshot_build:
+            # Penulisan yang datang selama build menjadwalkan build berikutnya
+            with _snapshot_lock: _snapshot_state['scheduled'] = False
+            _build_snapshot()
+    threading.Thread(target=run, daemon=True, name='catalog-snapshot').start()
+
+def get_catalog_stats():
+    """Jumlah resep/bahan, bahan unik, rata-rata bahan per resep dan 10 bahan terpopuler."""
+    snap = get_snapshot()
+    if snap is not None: return {**snapshot.stats(snap), 'source': 'snapshot'}
+    df = run_query('''SELECT (SELECT count(*) FROM recipes) AS recipes, (SELECT count(*) FROM ingredients) AS ingredient_rows,
+                               (SELECT count(*) FROM ingredient_catalog) AS unique_ingredients,
+                               (SELECT COALESCE(avg(ingredient_count), 0) FROM recipes) AS avg_ingredients''',
+                   fetch_data=True, replica=True)
+    top = get_ingredient_catalog()
+    if df is None or top is None: return None
+    return {**{k: v for k, v in df.iloc[0].items()}, 'source': 'database',
+            'top_ingredients': list(zip(top['ingredient_key'].head(10), top['usage_count'].head(10)))}
+
+def suggest_ingredients(query, limit=20):
+    """Saran nama bahan (type-ahead, toleran salah ketik); query kosong = bahan terpopuler."""
+    index = get_recipe_index()
+    return index.suggest(query, limit) if index is not None else []
+
+def find_matching_recipes(user_ingredients, top_k=None):
+    index = get_recipe_index()
+    return index.search(user_ingredients, top_k) if index is not None else []
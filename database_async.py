@@ -0,0 +1,176 @@
+# database_async.py
+"""Akses database asyncio (psycopg 3) untuk mengambil beberapa data halaman secara bersamaan.
+
+Nama fungsi sama dengan database.py dan berbagi cache katalog yang sama. Halaman
+Streamlit tetap sinkron dan memakai facade `fetch_all`:
+
+    data = adb.fetch_all(recipes=(adb.get_all_recipes,), shopping=(adb.get_shopping_list, menu))
+
+Semua query dijalankan bersamaan di event loop latar belakang, sehingga waktu
+render mengikuti query paling lambat, bukan jumlah semuanya. Tanpa psycopg 3,
+`fetch_all` menjalankan fungsi sinkron database.py secara berurutan.
+"""
+import streamlit as st
+import asyncio
+import contextvars
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+import pandas as pd
+import database as db
+import metrics
+import utils
+from config import get_setting
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except ImportError: # psycopg 3 opsional
+    AsyncConnectionPool = None
+
+_ctx = contextvars.ContextVar('adb_ctx')
+_busy = Counter() # koneksi yang sedang dipakai per pool (hanya diubah dari event loop)
+
+@st.cache_resource
+def get_runtime():
+    """Event loop latar belakang + pool koneksi async, satu per proses.
+
+    Pool async punya batas sendiri, DB_ASYNC_POOL_MAX (default 4), di samping pool sinkron
+    DB_POOL_MAX: koneksi per proses paling banyak DB_POOL_MAX + DB_ASYNC_POOL_MAX.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True, name='db-async').start()
+
+    # Semua query di modul ini hanya baca, jadi batas waktunya dipasang per koneksi
+    timeout_ms = db.get_db_settings().read_timeout_ms
+    max_size = int(get_setting("DB_ASYNC_POOL_MAX", 4))
+
+    async def open_pool(dsn, timeout):
+        pool = AsyncConnectionPool(
+            dsn,
+            min_size=min(int(get_setting("DB_POOL_MIN", 1)), max_size),
+            max_size=max_size,
+            timeout=timeout,
+            kwargs={'options': f"-c statement_timeout={timeout_ms}"},
+            check=AsyncConnectionPool.check_connection, open=False)
+        await pool.open()
+        return pool
+    run = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+    replica = get_setting("DATABASE_REPLICA_URL")
+    return SimpleNamespace(
+        loop=loop, pool=run(open_pool(get_setting("DATABASE_URL"), float(get_setting("DB_POOL_TIMEOUT", 30)))),
+        replica=run(open_pool(replica, float(get_setting("DB_REPLICA_POOL_TIMEOUT", 5)))) if replica else None)
+
+# --- HELPER ---
+
+async def _execute(pool, query, params, fetch_data):
+    async with pool.connection() as conn: # commit otomatis saat keluar blok
+        _busy[pool] += 1
+        try:
+            async with conn.cursor() as c:
+                await c.execute(query, params)
+                if not fetch_data: return None, 0, 0.0
+                fetched = await c.fetchall()
+                build_start = time.perf_counter()
+                data = pd.DataFrame(fetched, columns=[d.name for d in c.description])
+                return data, len(fetched), time.perf_counter() - build_start
+        finally:
+            _busy[pool] -= 1
+
+async def run_query(query, params=None, fetch_data=False, caller='-'):
+    """Query baca lewat replika (jika ada dan sesi tidak baru menulis), ulang ke primary jika replika putus.
+
+    Replika yang tidak terjangkau ditandai down di ReplicaRouter database.py (dilewati selama
+    DB_REPLICA_RETRY detik); jika pool replika hanya penuh, hanya panggilan ini yang dialihkan.
+    """
+    ctx = _ctx.get()
+    start = time.perf_counter()
+    rows, build, error = 0, 0.0, True
+    try:
+        try:
+            data, rows, build = await _execute(ctx.read_pool, query, params, fetch_data)
+        except (psycopg.OperationalError, PoolTimeout) as e:
+            if ctx.read_pool is ctx.pool or isinstance(e, psycopg.errors.QueryCanceled): raise
+            if isinstance(e, PoolTimeout) and _busy[ctx.read_pool] >= ctx.read_pool.max_size: ctx.router.fell_back()
+            else: ctx.router.mark_down()
+            data, rows, build = await _execute(ctx.pool, query, params, fetch_data)
+        error = False
+        return data
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        metrics.get_registry().record(caller, ctx.page, query, ms, rows, build * 1000, error)
+        if ctx.trace is not None: ctx.trace.append((caller, ms, rows))
+
+async def _cached(key, args, load):
+    # Kunci sama dengan @cached_read di database.py agar cache dipakai bersama
+    ctx = _ctx.get()
+    cache = ctx.cache
+    epoch = cache.epoch
+    hit, value = cache.get((key, args))
+    if not hit:
+        value = await load()
+        if value is None: return None
+        # Seperti cached_read: hasil replika tepat setelah penulisan belum disimpan
+        if ctx.read_pool is ctx.pool or cache.settled(ctx.lag):
+            cache.set((key, args), value, epoch)
+    return value.copy() if hasattr(value, 'copy') else value
+
+# --- FUNGSI RESEP & BAHAN ---
+
+async def get_all_recipes():
+    return await _cached('get_all_recipes', (), lambda: run_query(
+        "SELECT * FROM recipes ORDER BY id", fetch_data=True, caller='get_all_recipes'))
+
+async def get_ingredients_by_recipe(id):
+    return await _cached('_get_ingredients_by_recipe', (int(id),), lambda: run_query(
+        "SELECT id, ingredient_name, quantity, unit FROM ingredients WHERE recipe_id=%s ORDER BY id",
+        (int(id),), fetch_data=True, caller='get_ingredients_by_recipe'))
+
+async def get_all_unique_ingredients():
+    async def load():
+        df = await run_query("SELECT display_name FROM ingredient_catalog ORDER BY usage_count DESC, display_name",
+                             fetch_data=True, caller='get_all_unique_ingredients')
+        return df['display_name'].tolist()
+    ings = await _cached('_get_all_unique_ingredients', (), load)
+    return ings if ings is not None else []
+
+async def get_shopping_list(menu):
+    if not menu: return pd.DataFrame(columns=['ingredient_name', 'unit', 'total_quantity'])
+    return await run_query(db._SHOPPING_SQL, db._menu_params(menu), fetch_data=True, caller='get_shopping_list')
+
+async def get_plan_totals(plan_id):
+    return await run_query(db._PLAN_TOTALS_SQL, db._plan_params([plan_id]), fetch_data=True, caller='get_plan_totals')
+
+async def get_ingredient_prices():
+    return await _cached('get_ingredient_prices', (), lambda: run_query(
+        f"SELECT {', '.join(utils.PRICE_COLUMNS)} FROM ingredient_prices ORDER BY display_name",
+        fetch_data=True, caller='get_ingredient_prices'))
+
+# --- FACADE SINKRON ---
+
+async def _gather(ctx, named):
+    _ctx.set(ctx)
+    results = await asyncio.gather(*(fn(*args) for fn, *args in named.values()), return_exceptions=True)
+    return dict(zip(named, results))
+
+def fetch_all(**named):
+    """Jalankan beberapa fungsi async bersamaan: fetch_all(nama=(fungsi, arg...)). Return dict nama -> hasil.
+
+    Seperti run_query, error ditampilkan dengan st.error dan hasilnya None.
+    """
+    if AsyncConnectionPool is None:
+        return {name: getattr(db, fn.__name__)(*args) for name, (fn, *args) in named.items()}
+
+    rt = get_runtime()
+    router = db.get_replica()
+    use_replica = rt.replica is not None and router is not None and router.available() and not db.recently_wrote()
+    ctx = SimpleNamespace(pool=rt.pool, read_pool=rt.replica if use_replica else rt.pool, router=router,
+                          lag=db.get_db_settings().sticky_seconds,
+                          cache=db.get_cache(), page=metrics.get_page(), trace=metrics.get_trace())
+    results = asyncio.run_coroutine_threadsafe(_gather(ctx, named), rt.loop).result()
+    for name, value in results.items():
+        if isinstance(value, Exception):
+            st.error(f"Error: {value}")
+            results[name] = None
+    return results
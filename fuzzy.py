@@ -0,0 +1,92 @@
+# fuzzy.py
+import heapq
+import re
+from difflib import SequenceMatcher
+from bisect import bisect_left
+from collections import Counter
+
+_SPACES = re.compile(r'\s+')
+
+def canonical(name):
+    """Identitas bahan: huruf kecil, spasi dirapikan. 'Bawang  Merah ' -> 'bawang merah'."""
+    return _SPACES.sub(' ', str(name).strip().lower())
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    """Index trigram in-process untuk saran type-ahead dan pencocokan nama yang salah ketik.
+
+    `names` berisi nama kanonik; `weights` (opsional) dipakai untuk mengurutkan
+    saran saat query kosong dan sebagai pemecah skor yang sama.
+    """
+    # Trigram yang sangat umum (mis. '  b') hanya dipakai jika trigram lain tidak cukup
+    COMMON_LIMIT = 5000
+
+    def __init__(self, names, weights=None):
+        self.names = list(dict.fromkeys(names))
+        self.weights = [weights.get(n, 0) for n in self.names] if weights else [0] * len(self.names)
+        self.sizes = []
+        self.postings = {}
+        for i, n in enumerate(self.names):
+            grams = trigrams(n)
+            self.sizes.append(len(grams))
+            for g in grams: self.postings.setdefault(g, []).append(i)
+        self.name_set = set(self.names)
+        self.sorted_names = sorted((n, i) for i, n in enumerate(self.names))
+        self.popular = sorted(range(len(self.names)), key=lambda i: -self.weights[i])
+
+    def _prefix(self, q, limit):
+        out = []
+        pos = bisect_left(self.sorted_names, (q, -1))
+        while pos < len(self.sorted_names) and len(out) < limit:
+            name, i = self.sorted_names[pos]
+            if not name.startswith(q): break
+            out.append(i)
+            pos += 1
+        return out
+
+    def scored(self, query, limit=10, prefix_first=True):
+        """Return [(similarity, nama kanonik)] terbaik, similarity = Jaccard trigram (0..1)."""
+        q = canonical(query)
+        if not q: return [(0.0, self.names[i]) for i in self.popular[:limit]]
+        q_grams = trigrams(q)
+        if prefix_first and len(q) <= 3: # query pendek: trigramnya terlalu umum, cukup pencarian prefix
+            hits = self._prefix(q, limit)
+            if hits: return [(len(q_grams & trigrams(self.names[i])) / len(q_grams | trigrams(self.names[i])), self.names[i]) for i in hits]
+        lists = sorted((self.postings[g] for g in q_grams if g in self.postings), key=len)
+        if not lists: return []
+        # Posting list jarang hanya untuk mengumpulkan kandidat; skornya dihitung dari semua trigram query
+        rare = [p for p in lists if len(p) <= self.COMMON_LIMIT]
+        cands = set().union(*(rare if len(rare) >= 2 else lists[:2]))
+        if len(cands) * len(q_grams) < sum(map(len, lists)):
+            shared = {i: len(q_grams & trigrams(self.names[i])) for i in cands}
+        else: # kandidat sangat banyak: lebih murah menghitung semua posting list sekali
+            counts = Counter()
+            for p in lists: counts.update(p)
+            shared = {i: counts[i] for i in cands}
+
+        def sim(i):
+            s = shared[i]
+            return s / (len(q_grams) + self.sizes[i] - s)
+        if not prefix_first:
+            best = heapq.nlargest(limit, shared, key=lambda i: (sim(i), self.weights[i]))
+            return [(sim(i), self.names[i]) for i in best]
+        # Type-ahead: nama yang diawali query selalu ikut dan didahulukan
+        for i in self._prefix(q, limit):
+            shared.setdefault(i, len(q_grams & trigrams(self.names[i])))
+        best = heapq.nlargest(limit, shared, key=lambda i: (self.names[i].startswith(q), sim(i), self.weights[i]))
+        return [(sim(i), self.names[i]) for i in best]
+
+    def suggest(self, query, limit=10): return [n for _, n in self.scored(query, limit)]
+
+    def resolve(self, name, threshold=0.85):
+        """Nama kanonik yang dikenal untuk `name` (toleran salah ketik), atau kanonik `name` sendiri.
+
+        Kandidat diambil dari index trigram lalu diurutkan ulang dengan rasio edit (difflib).
+        """
+        c = canonical(name)
+        if c in self.name_set: return c
+        best = max(((SequenceMatcher(None, c, n).ratio(), n) for _, n in self.scored(c, 5, prefix_first=False)), default=None)
+        return best[1] if best and best[0] >= threshold else c
@@ -0,0 +1,223 @@
+# loadtest.py
+"""Load test app.py: banyak sesi Streamlit headless (AppTest) bersamaan terhadap Postgres.
+
+Contoh:
+    LOADTEST_DATABASE_URL=postgresql://localhost/postgres python loadtest.py
+    python loadtest.py --dsn postgresql://localhost/postgres --levels 1,5,10,25,50 --duration 20
+
+Setiap pengguna virtual adalah satu AppTest (sesi sendiri) dalam proses ini, jadi
+pool koneksi, cache dan thread latar belakang dipakai bersama seperti pada satu
+instance aplikasi. Pengguna login sekali lalu mengulang alur acak (tambah menu,
+cari resep dari stok, dan untuk admin: tambah resep) selama --duration detik per
+tingkat konkurensi. Katalog sintetis dimuat ke schema sementara `loadtest_<pid>`
+yang dihapus lagi di akhir. Hasil ditambahkan ke loadtest_results.jsonl.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+
+from benchmark import generate_catalogue, git_commit
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+SEARCH_WORDS = ['bawang', 'cabai', 'telur', 'ayam', 'gula', 'santan', 'tahu', 'tomat']
+
+def rss_kib():
+    """Resident set size proses ini (KiB)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentiles(times):
+    if not times: return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    q = statistics.quantiles(times, n=100, method='inclusive') if len(times) > 1 else times * 99
+    return {'p50_ms': round(statistics.median(times), 2), 'p95_ms': round(q[94], 2), 'p99_ms': round(q[98], 2)}
+
+def _by_label(widgets, label): return next(w for w in widgets if w.label == label)
+
+class Session:
+    """Satu pengguna virtual = satu AppTest (satu sesi Streamlit)."""
+    def __init__(self, username, password, admin, timeout, seed):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.username, self.password, self.admin = username, password, admin
+        self.rng = random.Random(seed)
+        self.added = 0
+
+    def _run(self, widget=None):
+        (widget.run() if widget is not None else self.at.run())
+        if self.at.exception: raise RuntimeError(self.at.exception[0].message)
+
+    def login(self):
+        self._run()
+        _by_label(self.at.text_input, "Username").input(self.username)
+        _by_label(self.at.text_input, "Password").input(self.password)
+        self._run(_by_label(self.at.button, "Masuk Sistem").click())
+
+    def _calculator_tab(self, label):
+        if self.admin and self.at.sidebar.radio[0].value != "Kalkulator":
+            self._run(self.at.sidebar.radio[0].set_value("Kalkulator"))
+        self._run(self.at.radio(key='calc_tab').set_value(label))
+
+    def add_menu(self):
+        self._calculator_tab("🛒 Hitung Belanja")
+        if self.added >= 10: # daftar dijaga pendek agar ukuran halaman tidak terus membesar
+            self._run(_by_label(self.at.button, "Reset Daftar Belanja").click())
+            self.added = 0
+        sb = _by_label(self.at.selectbox, "Daftar Resep")
+        sb.select_index(self.rng.randrange(len(sb.options)))
+        _by_label(self.at.number_input, "Jumlah Porsi").set_value(self.rng.randint(1, 10))
+        self._run(_by_label(self.at.button, "Tambah ke Daftar").click())
+        self.added += 1
+
+    def stock_search(self):
+        self._calculator_tab("🔍 Cari Resep dari Stok")
+        self._run(_by_label(self.at.text_input, "Ketik nama bahan:").input(self.rng.choice(SEARCH_WORDS)))
+        ms = self.at.multiselect(key='stock_sel')
+        ms.set_value(ms.options[:3])
+        self._run(_by_label(self.at.button, "Cari Inspirasi Resep").click())
+
+    def admin_edit(self):
+        self._run(self.at.sidebar.radio[0].set_value("Resep"))
+        self._run(self.at.radio(key='recipe_tab').set_value("➕ Tambah Resep"))
+        _by_label(self.at.text_input, "Nama Masakan").input(f"Loadtest {self.username} {self.rng.random():.9f}")
+        self._run(_by_label(self.at.button, "Simpan Resep Baru").click())
+
+    def flows(self):
+        flows = [('add_menu', self.add_menu), ('stock_search', self.stock_search)]
+        return flows + [('admin_edit', self.admin_edit)] if self.admin else flows
+
+class Sampler(threading.Thread):
+    """Sampel koneksi DB (pool aplikasi & pg_stat_activity) dan RSS selama satu tingkat berjalan."""
+    def __init__(self, dsn, interval=0.5):
+        super().__init__(daemon=True)
+        self.dsn, self.interval = dsn, interval
+        self.stop = threading.Event()
+        self.pool_in_use, self.pg_conns, self.rss = [], [], []
+
+    def run(self):
+        import psycopg2
+        import database as db
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        try:
+            while not self.stop.wait(self.interval):
+                self.pool_in_use.append(db.get_pool_stats()['in_use'])
+                with conn.cursor() as c:
+                    c.execute('''SELECT count(*) FROM pg_stat_activity
+                                 WHERE datname = current_database() AND pid <> pg_backend_pid()''')
+                    self.pg_conns.append(c.fetchone()[0])
+                self.rss.append(rss_kib())
+        finally:
+            conn.close()
+
+def run_level(n, users, args):
+    latencies, errors = defaultdict(list), Counter()
+    lock = threading.Lock()
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            with lock: errors[f"{name}: {type(e).__name__}: {str(e)[:80]}"] += 1
+            return False
+        with lock: latencies[name].append((time.perf_counter() - start) * 1000)
+        return True
+
+    def in_parallel(fn, items):
+        threads = [threading.Thread(target=fn, args=(x,)) for x in items]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+    rss_before = rss_kib()
+    sessions = [Session(u, p, admin, args.timeout, seed=i) for i, (u, p, admin) in enumerate(users[:n])]
+    in_parallel(lambda s: timed('login', s.login), sessions)
+    mem_per_session = (rss_kib() - rss_before) / n
+
+    sampler = Sampler(args.dsn)
+    sampler.start()
+    stop_at = time.monotonic() + args.duration
+    start = time.perf_counter()
+
+    def worker(s):
+        while time.monotonic() < stop_at:
+            timed(*s.rng.choice(s.flows()))
+    in_parallel(worker, sessions)
+    elapsed = time.perf_counter() - start
+    sampler.stop.set()
+    sampler.join()
+
+    flows = [ms for name, ms in latencies.items() if name != 'login']
+    all_ms = [x for ms in flows for x in ms]
+    return {
+        'sessions': n, 'seconds': round(elapsed, 2), 'flows': len(all_ms),
+        'flows_per_sec': round(len(all_ms) / elapsed, 2), **percentiles(all_ms),
+        'per_flow': {name: {'count': len(ms), **percentiles(ms)} for name, ms in sorted(latencies.items())},
+        'errors': dict(errors),
+        'pool_in_use_max': max(sampler.pool_in_use, default=0),
+        'pg_connections_max': max(sampler.pg_conns, default=0),
+        'rss_kib_max': max(sampler.rss, default=rss_kib()),
+        'mem_per_session_kib': round(mem_per_session, 1),
+    }
+
+def setup(args):
+    """Schema sementara + katalog sintetis + akun pengguna virtual. Return (schema, koneksi admin, users, levels)."""
+    import psycopg2
+    import psycopg2.extensions
+    schema = f"loadtest_{os.getpid()}"
+    admin = psycopg2.connect(args.dsn); admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    # public tetap di search_path agar operator ekstensi (pg_trgm) yang sudah terpasang di sana terlihat
+    os.environ['DATABASE_URL'] = psycopg2.extensions.make_dsn(args.dsn, options=f"-c search_path={schema},public")
+    import database as db
+    db.setup_database()
+    db.bulk_import_recipes(generate_catalogue(args.catalogue))
+    levels = [int(x) for x in args.levels.split(',')]
+    n_users = max(levels)
+    n_admin = round(n_users * args.admin_ratio)
+    users = [(f"lt_user_{i:04d}", f"lt_pass_{i}", i < n_admin) for i in range(n_users)]
+    for u, p, is_admin in users: db.create_user(u, p, 'admin' if is_admin else 'user')
+    return schema, admin, users, levels
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--dsn', default=os.environ.get('LOADTEST_DATABASE_URL'), help="Postgres sekali pakai (wajib)")
+    ap.add_argument('--levels', default='1,5,10,25', help="jumlah sesi bersamaan per tingkat, dipisah koma")
+    ap.add_argument('--duration', type=float, default=20, help="detik per tingkat")
+    ap.add_argument('--catalogue', type=int, default=10000, help="jumlah baris bahan katalog sintetis")
+    ap.add_argument('--admin-ratio', type=float, default=0.1)
+    ap.add_argument('--timeout', type=float, default=60, help="batas waktu satu rerun AppTest (detik)")
+    ap.add_argument('--out', default='loadtest_results.jsonl')
+    args = ap.parse_args()
+    if not args.dsn: ap.error("butuh --dsn atau LOADTEST_DATABASE_URL")
+
+    schema, admin, users, levels = setup(args)
+    commit = git_commit()
+    try:
+        with open(args.out, 'a') as out:
+            for n in levels:
+                res = run_level(n, users, args)
+                out.write(json.dumps({'commit': commit, 'ts': int(time.time()), **res}) + '\n')
+                print(f"{n:>4} sesi  {res['flows_per_sec']:>7.2f} alur/s  p50={res['p50_ms']}ms p95={res['p95_ms']}ms "
+                      f"p99={res['p99_ms']}ms  pool={res['pool_in_use_max']} pg={res['pg_connections_max']}  "
+                      f"rss={res['rss_kib_max'] / 1024:.0f}MiB ({res['mem_per_session_kib']:.0f}KiB/sesi)  "
+                      f"error={sum(res['errors'].values())}")
+                for name, r in res['per_flow'].items():
+                    print(f"       {name:14} n={r['count']:<6} p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms")
+                for err, count in res['errors'].items(): print(f"       ! {count}x {err}")
+    finally:
+        import database as db
+        db.get_pool()._pool.closeall()
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+if __name__ == '__main__':
+    main()
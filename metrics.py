@@ -0,0 +1,143 @@
+# metrics.py
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from config import get_setting
+
+# Batas atas bucket histogram latensi (ms)
+BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf')]
+
+_local = threading.local() # halaman aktif per thread script (satu thread per sesi Streamlit)
+
+def set_page(page): _local.page = page
+def get_page(): return getattr(_local, 'page', None) or '-'
+
+# Daftar (caller, ms, rows) milik rerun yang sedang diprofil (lihat profiling.py), None jika tidak aktif
+def set_trace(trace): _local.trace = trace
+def get_trace(): return getattr(_local, 'trace', None)
+
+class QueryStats:
+    def __init__(self):
+        self.count = self.errors = self.rows = 0
+        self.total_ms = self.max_ms = self.build_ms = 0.0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, ms, rows, build_ms, error):
+        self.count += 1
+        self.errors += int(error)
+        self.rows += rows
+        self.total_ms += ms
+        self.build_ms += build_ms
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+class QueryMetrics:
+    """Latensi, jumlah baris dan waktu bangun DataFrame per (caller, halaman), plus log query lambat."""
+    def __init__(self, slow_ms=500, slow_log_size=200, slow_log_file=None):
+        self.slow_ms, self.slow_log_file = slow_ms, slow_log_file
+        self.stats = {}
+        self.slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, caller, page, query, ms, rows=0, build_ms=0.0, error=False):
+        with self._lock:
+            self.stats.setdefault((caller, page), QueryStats()).add(ms, rows, build_ms, error)
+            if ms < self.slow_ms: return
+            entry = {'ts': time.time(), 'caller': caller, 'page': page, 'ms': round(ms, 2),
+                     'rows': rows, 'query': ' '.join(query.split())[:500]}
+            self.slow.append(entry)
+        if self.slow_log_file:
+            with open(self.slow_log_file, 'a') as f: f.write(json.dumps(entry) + '\n')
+
+    def rows(self):
+        with self._lock:
+            return [{'caller': c, 'page': p, 'count': s.count, 'errors': s.errors,
+                     'avg_ms': s.total_ms / s.count, 'max_ms': s.max_ms, 'rows': s.rows,
+                     'avg_build_ms': s.build_ms / s.count, 'buckets': list(s.buckets)}
+                    for (c, p), s in sorted(self.stats.items())]
+
+    def slow_queries(self):
+        with self._lock: return list(self.slow)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.slow.clear()
+
+    def to_json(self):
+        return json.dumps({'queries': self.rows(), 'slow': self.slow_queries()}, indent=2)
+
+    def to_prometheus(self):
+        out = ['# TYPE app_db_query_ms histogram']
+        for r in self.rows():
+            labels = f'caller="{r["caller"]}",page="{r["page"]}"'
+            acc = 0
+            for bound, n in zip(BUCKETS_MS, r['buckets']):
+                acc += n
+                le = '+Inf' if bound == float('inf') else bound
+                out.append(f'app_db_query_ms_bucket{{{labels},le="{le}"}} {acc}')
+            out.append(f'app_db_query_ms_sum{{{labels}}} {r["avg_ms"] * r["count"]:.3f}')
+            out.append(f'app_db_query_ms_count{{{labels}}} {r["count"]}')
+        out.append('# TYPE app_db_query_rows_total counter')
+        out += [f'app_db_query_rows_total{{caller="{r["caller"]}",page="{r["page"]}"}} {r["rows"]}' for r in self.rows()]
+        out.append('# TYPE app_db_query_errors_total counter')
+        out += [f'app_db_query_errors_total{{caller="{r["caller"]}",page="{r["page"]}"}} {r["errors"]}' for r in self.rows()]
+        return '\n'.join(out) + '\n'
+
+    def export(self, path):
+        """Tulis metrik ke file lokal; format mengikuti ekstensi (.json atau Prometheus text)."""
+        data = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f: f.write(data)
+        os.replace(tmp, path)
+        return path
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = QueryMetrics(slow_ms=float(get_setting("SLOW_QUERY_MS", 500)),
+                                     slow_log_file=get_setting("SLOW_QUERY_LOG"))
+        return _registry
+
+def _caller():
+    # Fungsi database.py terluar di call stack, misalnya get_all_recipes atau find_matching_recipes
+    f, name = sys._getframe(1), '-'
+    while f is not None:
+        if os.path.basename(f.f_code.co_filename) == 'database.py':
+            if f.f_code.co_name != 'wrapper': name = f.f_code.co_name # lewati wrapper cached_read
+        elif name != '-': break
+        f = f.f_back
+    return name
+
+class _Tracked:
+    rows = 0
+    build_seconds = 0.0
+
+@contextmanager
+def track(query):
+    """Ukur satu query. Pemanggil boleh mengisi `.rows` dan `.build_seconds` pada objek yang di-yield."""
+    m = _Tracked()
+    caller, page = _caller(), get_page()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield m
+    except Exception:
+        error = True
+        raise
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        get_registry().record(caller, page, query, ms, m.rows, m.build_seconds * 1000, error)
+        trace = get_trace()
+        if trace is not None: trace.append((caller, ms, m.rows))
@@ -0,0 +1,142 @@
+# profiling.py
+"""Mode profiling per rerun, aktif dengan PROFILE=1 (env/secrets) atau ?profile=1 di URL (hanya admin).
+
+Durasi tiap bagian (`profiling.section`) dan tiap query DB dicatat, ditampilkan di
+sidebar, dan cProfile rerun ditulis ke PROFILE_DIR sebagai file .prof (bisa dibuka
+dengan snakeviz, atau flameprof untuk flamegraph). Saat mode tidak aktif, `section`
+hanya membaca satu atribut thread-local.
+"""
+import streamlit as st
+import cProfile
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+from config import get_setting
+
+HISTORY = 20 # jumlah rerun terakhir yang disimpan per sesi (dan file .prof terakhir di PROFILE_DIR)
+
+_local = threading.local()
+
+def enabled():
+    if str(get_setting("PROFILE", "")).lower() in ('1', 'true', 'yes'): return True
+    # Parameter URL hanya untuk admin yang sudah login: tiap rerun menulis file dan menawarkan unduhan
+    return st.query_params.get('profile') == '1' and st.session_state.get('logged_in') and st.session_state.get('role') == 'admin'
+
+class Run:
+    def __init__(self):
+        self.ts = time.time()
+        self.start = self.last = time.perf_counter()
+        self.sections = [] # (nama, kedalaman, ms)
+        self.queries = []  # (caller, ms, rows), diisi metrics.track / database_async
+        self.depth = 0
+        self.total_ms = None
+        self.interrupted = False
+        self.path = None
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError: # profiler lain sedang aktif (mis. sesi lain di Python 3.12+)
+            self.profile = None
+
+    def top_functions(self, limit=15):
+        if self.profile is None: return []
+        stats = pstats.Stats(self.profile).stats
+        top = sorted(stats.items(), key=lambda kv: -kv[1][3])[:limit]
+        return [{'fungsi': f"{os.path.basename(f)}:{line}({fn})", 'panggilan': nc,
+                 'total_ms': round(ct * 1000, 2), 'sendiri_ms': round(tt * 1000, 2)}
+                for (f, line, fn), (cc, nc, tt, ct, _) in top]
+
+def current():
+    return getattr(_local, 'run', None)
+
+def begin():
+    """Panggil di baris awal app.py. Return Run aktif atau None jika mode profiling mati."""
+    pending = st.session_state.pop('_profile_pending', None)
+    if pending is not None: # rerun sebelumnya dihentikan st.rerun()/st.stop() sebelum finish()
+        pending.interrupted = True
+        _close(pending)
+    if not enabled():
+        _local.run = None
+        metrics.set_trace(None)
+        return None
+    run = _local.run = Run()
+    st.session_state['_profile_pending'] = run
+    metrics.set_trace(run.queries)
+    return run
+
+@contextmanager
+def section(name):
+    run = current()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    idx, run.depth = len(run.sections), run.depth + 1
+    run.sections.append((name, run.depth - 1, None))
+    try:
+        yield
+    finally:
+        run.depth -= 1
+        run.last = time.perf_counter()
+        run.sections[idx] = (name, run.depth, (run.last - start) * 1000)
+
+def _close(run):
+    if run.profile is not None: run.profile.disable()
+    end = time.perf_counter() if not run.interrupted else run.last
+    run.total_ms = (end - run.start) * 1000
+    if run.profile is not None:
+        folder = get_setting("PROFILE_DIR", "profiles")
+        try:
+            os.makedirs(folder, exist_ok=True)
+            run.path = os.path.join(folder, f"rerun_{int(run.ts * 1000)}.prof")
+            run.profile.dump_stats(run.path)
+            _prune(folder)
+        except OSError:
+            run.path = None
+    history = st.session_state.setdefault('_profile_history', [])
+    history.append({'waktu': time.strftime('%H:%M:%S', time.localtime(run.ts)), 'total_ms': round(run.total_ms, 1),
+                    'query': len(run.queries), 'query_ms': round(sum(q[1] for q in run.queries), 1),
+                    'terputus': run.interrupted})
+    del history[:-HISTORY]
+
+def _prune(folder):
+    # Nama file memuat timestamp dengan panjang tetap, jadi urutan nama = urutan waktu
+    files = sorted(f for f in os.listdir(folder) if f.startswith('rerun_') and f.endswith('.prof'))
+    for f in files[:-HISTORY]:
+        try:
+            os.remove(os.path.join(folder, f))
+        except FileNotFoundError: # sudah dihapus sesi lain
+            pass
+
+def finish():
+    """Panggil di akhir app.py: tutup rerun aktif dan tampilkan panel profil di sidebar."""
+    run = current()
+    if run is None: return
+    _local.run = None
+    metrics.set_trace(None)
+    st.session_state.pop('_profile_pending', None)
+    _close(run)
+    render(run)
+
+def render(run):
+    with st.sidebar.expander(f"⏱️ Profil Rerun ({run.total_ms:.0f} ms)", expanded=True):
+        st.caption("Bagian halaman")
+        st.dataframe([{'bagian': '· ' * depth + name, 'ms': round(ms or 0, 2)} for name, depth, ms in run.sections],
+                     hide_index=True, use_container_width=True)
+        st.caption(f"Query DB: {len(run.queries)} ({sum(q[1] for q in run.queries):.1f} ms)")
+        if run.queries:
+            st.dataframe([{'caller': c, 'ms': round(ms, 2), 'baris': rows} for c, ms, rows in run.queries],
+                         hide_index=True, use_container_width=True)
+        top = run.top_functions()
+        if top:
+            st.caption("Fungsi terberat (kumulatif, thread script saja)")
+            st.dataframe(top, hide_index=True, use_container_width=True)
+        st.caption("Rerun terakhir")
+        st.dataframe(st.session_state.get('_profile_history', [])[::-1], hide_index=True, use_container_width=True)
+        if run.path:
+            with open(run.path, 'rb') as f:
+                st.download_button("📥 cProfile (.prof)", f.read(), file_name=os.path.basename(run.path),
+                                   mime="application/octet-stream")
@@ -0,0 +1,145 @@
+# security.py
+import streamlit as st
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cache_backend
+from config import get_setting
+
+try:
+    import bcrypt
+except ImportError: # bcrypt opsional, fallback ke PBKDF2 bawaan hashlib
+    bcrypt = None
+
+# --- HASHER PASSWORD ---
+
+class Pbkdf2Hasher:
+    name = 'pbkdf2_sha256'
+    def __init__(self, iterations=260000): self.iterations = iterations
+    def hash(self, password):
+        salt = secrets.token_hex(16)
+        dk = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), self.iterations)
+        return f"{self.name}${self.iterations}${salt}${dk.hex()}"
+    def identify(self, hashed): return hashed.startswith(self.name + '$')
+    def verify(self, password, hashed):
+        _, iterations, salt, hexdk = hashed.split('$')
+        dk = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), int(iterations))
+        return hmac.compare_digest(dk.hex(), hexdk)
+    def needs_rehash(self, hashed): return int(hashed.split('$')[1]) < self.iterations
+
+class BcryptHasher:
+    name = 'bcrypt'
+    def __init__(self, rounds=12): self.rounds = rounds
+    @staticmethod
+    def _prepare(password):
+        # bcrypt hanya menerima 72 byte; password lebih panjang di-hash dulu (hash lama <= 72 byte tetap cocok)
+        raw = password.encode()
+        return base64.b64encode(hashlib.sha256(raw).digest()) if len(raw) > 72 else raw
+    def hash(self, password): return bcrypt.hashpw(self._prepare(password), bcrypt.gensalt(self.rounds)).decode()
+    def identify(self, hashed): return hashed.startswith(('$2a$', '$2b$', '$2y$'))
+    def verify(self, password, hashed): return bcrypt.checkpw(self._prepare(password), hashed.encode())
+    def needs_rehash(self, hashed): return int(hashed.split('$')[2]) < self.rounds
+
+class LegacySha256Hasher:
+    """Hash lama (SHA-256 tanpa salt). Hanya untuk verifikasi, selalu di-rehash."""
+    name = 'sha256'
+    def hash(self, password): return hashlib.sha256(str.encode(password)).hexdigest()
+    def identify(self, hashed): return re.fullmatch(r'[0-9a-f]{64}', hashed) is not None
+    def verify(self, password, hashed): return hmac.compare_digest(self.hash(password), hashed)
+    def needs_rehash(self, hashed): return True
+
+HASHERS = {h.name: h for h in [Pbkdf2Hasher(), LegacySha256Hasher()] + ([BcryptHasher()] if bcrypt else [])}
+
+def get_hasher():
+    return HASHERS[get_setting("PASSWORD_HASHER", 'bcrypt' if bcrypt else 'pbkdf2_sha256')]
+
+def hash_password(password): return get_hasher().hash(password)
+
+def verify_password(password, hashed):
+    """Return (cocok, perlu_rehash)."""
+    if not hashed: return False, False
+    for h in HASHERS.values():
+        if h.identify(hashed):
+            try:
+                ok = h.verify(password, hashed)
+            except ValueError: # hash rusak/tidak didukung
+                return False, False
+            current = get_hasher()
+            return ok, ok and (h is not current or h.needs_rehash(hashed))
+    return False, False
+
+@st.cache_resource
+def get_hash_executor():
+    # Dibatasi agar login bersamaan tidak menghabiskan semua CPU proses
+    return ThreadPoolExecutor(max_workers=int(get_setting("PASSWORD_WORKERS", 2)), thread_name_prefix='pwhash')
+
+def verify_password_async(password, hashed): return get_hash_executor().submit(verify_password, password, hashed)
+def hash_password_async(password): return get_hash_executor().submit(hash_password, password)
+
+# --- TOKEN SESI ---
+
+@st.cache_resource
+def _fallback_secret():
+    # Tanpa SESSION_SECRET, token hanya berlaku selama proses ini hidup
+    return os.urandom(32)
+
+def _secret():
+    s = get_setting("SESSION_SECRET")
+    if s: return s.encode()
+    if cache_backend.get_backend().shared: # ada beberapa proses/replika: secret acak per proses saling menolak token
+        raise RuntimeError("SESSION_SECRET wajib diisi jika CACHE_BACKEND dibagi antar proses/replika")
+    return _fallback_secret()
+
+def _b64(data): return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+def _unb64(text): return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def issue_token(username, role, ttl=None):
+    ttl = ttl if ttl is not None else int(get_setting("SESSION_TTL", 7 * 24 * 3600))
+    payload = _b64(json.dumps({'u': username, 'r': role, 'exp': int(time.time()) + ttl, 'j': secrets.token_hex(8)}).encode())
+    sig = _b64(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{sig}"
+
+def _decode(token):
+    payload, sig = token.split('.')
+    expected = _b64(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(sig, expected): return None
+    data = json.loads(_unb64(payload))
+    return data if data['exp'] >= time.time() else None
+
+def _revoked(jti):
+    try:
+        return cache_backend.get_backend().get(f"revoked:{jti}") is not None
+    except Exception: # backend bersama mati: daftar logout tidak bisa dicek, token tetap diterima
+        return False
+
+def verify_token(token):
+    """Return (username, role) jika token valid, belum kedaluwarsa dan belum di-logout, selain itu None."""
+    try:
+        data = _decode(token)
+        if data is None: return None
+        if 'j' in data and _revoked(data['j']): return None
+        return data['u'], data['r']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def revoke_token(token):
+    """Tandai token sudah logout di backend bersama (berlaku di semua replika) sampai kedaluwarsa.
+
+    Return False jika token tidak dikenali atau backend sedang tidak bisa dihubungi.
+    """
+    try:
+        data = _decode(token)
+        if data is None or 'j' not in data: return False
+    except (ValueError, KeyError, TypeError):
+        return False
+    try:
+        cache_backend.get_backend().set(f"revoked:{data['j']}", b'1', ex=max(int(data['exp'] - time.time()), 1))
+    except Exception: # logout tetap jalan; token hanya tidak bisa dibatalkan di replika lain
+        return False
+    return True
@@ -0,0 +1,112 @@
+# snapshot.py
+"""Snapshot kolumnar katalog resep (Arrow IPC) untuk index pencarian dan statistik.
+
+Aktif dengan CATALOG_SNAPSHOT=1 dan pyarrow terpasang. Satu file per tabel per versi
+katalog global (CatalogCache.version) di SNAPSHOT_DIR. File dibuka dengan memory map:
+kolom numerik dibaca tanpa salinan dan halaman file dibagi oleh semua proses di host
+yang sama. Arrow IPC dipakai (bukan Parquet) karena hanya format ini yang bisa di-mmap
+langsung tanpa dekompresi.
+"""
+import os
+import threading
+import time
+from config import get_setting
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError: # pyarrow opsional
+    pa = None
+
+TABLES = {
+    'recipes': "SELECT id, name, source_link, ingredient_count FROM recipes ORDER BY id",
+    'ingredients': '''SELECT id, recipe_id, ingredient_name, ingredient_key, quantity, unit
+                      FROM ingredients ORDER BY recipe_id, id''',
+}
+# Skema tetap per tabel: tipe tidak ditebak per potongan (kolom yang seluruhnya NULL di satu
+# potongan akan bertipe null dan menolak potongan berikutnya)
+SCHEMAS = {
+    'recipes': [('id', 'int32'), ('name', 'string'), ('source_link', 'string'), ('ingredient_count', 'int32')],
+    'ingredients': [('id', 'int32'), ('recipe_id', 'int32'), ('ingredient_name', 'string'),
+                    ('ingredient_key', 'string'), ('quantity', 'float64'), ('unit', 'string')],
+}
+KEEP_VERSIONS = 2 # versi lama yang masih dibiarkan untuk pembaca yang sedang berjalan
+LOCK_STALE = 300  # detik; lock build yang lebih tua dianggap sisa proses yang mati
+
+_loaded = {}
+_lock = threading.Lock()
+
+def enabled():
+    return pa is not None and str(get_setting("CATALOG_SNAPSHOT", "")).lower() in ('1', 'true', 'yes')
+
+def _folder(): return get_setting("SNAPSHOT_DIR", "snapshot")
+def _path(name, version): return os.path.join(_folder(), f"{name}_v{version}.arrow")
+def _schema(name): return pa.schema([(col, getattr(pa, t)()) for col, t in SCHEMAS[name]])
+
+def load(version):
+    """Dict nama -> pyarrow.Table versi `version` (memory-mapped), atau None jika belum dibangun."""
+    with _lock:
+        if version in _loaded: return _loaded[version]
+    paths = {name: _path(name, version) for name in TABLES}
+    if not all(os.path.exists(p) for p in paths.values()): return None
+    # Sumber mmap sengaja tidak ditutup: buffer tabel menunjuk langsung ke file
+    tables = {name: pa.ipc.open_file(pa.memory_map(p)).read_all() for name, p in paths.items()}
+    with _lock:
+        _loaded.clear() # versi lama dilepas, hanya versi terbaru yang dipegang proses ini
+        _loaded[version] = tables
+    return tables
+
+def build(version, fetch):
+    """Tulis snapshot versi `version`. `fetch(query)` mengembalikan iterator DataFrame per potongan.
+
+    Hanya satu proses yang membangun satu versi (file lock); yang lain mendapat None dan
+    tetap memakai database sampai file siap. Return tabel yang sudah di-mmap. Jika gagal,
+    exception diteruskan dan file sementara dihapus.
+    """
+    os.makedirs(_folder(), exist_ok=True)
+    lock = os.path.join(_folder(), f"build_v{version}.lock")
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if time.time() - os.path.getmtime(lock) < LOCK_STALE: return None
+        os.remove(lock)
+        return build(version, fetch)
+    try:
+        for name, query in TABLES.items():
+            path = _path(name, version)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            schema = _schema(name)
+            try:
+                with pa.ipc.new_file(tmp, schema) as writer:
+                    for df in fetch(query):
+                        writer.write_batch(pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False))
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp): os.remove(tmp)
+                raise
+    finally:
+        os.close(fd)
+        os.remove(lock)
+    prune(version)
+    return load(version)
+
+def prune(version):
+    for f in os.listdir(_folder()):
+        if not f.endswith('.arrow') or '_v' not in f: continue
+        try:
+            v = int(f.rsplit('_v', 1)[1][:-len('.arrow')])
+        except ValueError:
+            continue
+        if v <= version - KEEP_VERSIONS: os.remove(os.path.join(_folder(), f))
+
+def stats(tables):
+    """Statistik katalog dihitung langsung di kolom Arrow (tanpa DataFrame)."""
+    recipes, ings = tables['recipes'], tables['ingredients']
+    counts = pc.value_counts(ings['ingredient_key']).to_pylist()
+    top = sorted((c for c in counts if c['values'] is not None), key=lambda c: -c['counts'])[:10]
+    return {
+        'recipes': recipes.num_rows, 'ingredient_rows': ings.num_rows, 'unique_ingredients': len(counts),
+        'avg_ingredients': pc.mean(recipes['ingredient_count']).as_py() or 0.0,
+        'top_ingredients': [(c['values'], c['counts']) for c in top],
+        'snapshot_mib': (recipes.nbytes + ings.nbytes) / 2 ** 20,
+    }
@@ -0,0 +1,37 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def db():
+    """Modul database terhadap schema sementara di TEST_DATABASE_URL (Postgres sekali pakai)."""
+    dsn = os.environ.get('TEST_DATABASE_URL')
+    if not dsn: pytest.skip("butuh TEST_DATABASE_URL")
+    import psycopg2
+    import psycopg2.extensions
+    schema = f"test_{os.getpid()}"
+    admin = psycopg2.connect(dsn); admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    os.environ['DATABASE_URL'] = psycopg2.extensions.make_dsn(dsn, options=f"-c search_path={schema},public")
+    import database
+    database.setup_database()
+    try:
+        yield database
+    finally:
+        database.get_pool()._pool.closeall()
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+class _DownBackend:
+    """Backend cache bersama yang sedang mati: semua operasi gagal."""
+    shared = True
+    def get(self, key): raise ConnectionError("backend mati")
+    def set(self, key, value, ex=None): raise ConnectionError("backend mati")
+
+@pytest.fixture
+def down_backend():
+    return _DownBackend()
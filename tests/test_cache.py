@@ -0,0 +1,58 @@
+# tests/test_cache.py
+import time
+
+import cache_backend
+from database import CatalogCache
+
+def test_get_set_and_bump_invalidate():
+    cache = CatalogCache()
+    assert cache.get('k') == (False, None)
+    cache.set('k', 1, cache.epoch)
+    assert cache.get('k') == (True, 1)
+    cache.bump()
+    assert cache.get('k') == (False, None)
+
+def test_value_read_before_a_write_is_not_stored():
+    cache = CatalogCache()
+    epoch = cache.epoch
+    cache.bump() # penulisan terjadi selama data dibaca
+    cache.set('k', 'basi', epoch)
+    assert cache.get('k') == (False, None)
+
+def test_ttl_and_lru_eviction():
+    cache = CatalogCache(ttl=0.05, max_entries=2)
+    for k in 'abc': cache.set(k, k, cache.epoch)
+    assert cache.get('a') == (False, None) and cache.stats()['evictions'] == 1
+    time.sleep(0.06)
+    assert cache.get('c') == (False, None)
+
+def test_global_version_only_moves_forward():
+    cache = CatalogCache()
+    assert cache.global_version() is None
+    cache.bump(5)
+    cache.set('k', 1, cache.epoch)
+    cache.bump(3) # NOTIFY lama yang datang terlambat
+    assert cache.global_version() == 5 and cache.get('k') == (True, 1)
+    cache.bump() # fallback lokal: versi global belum pasti lagi
+    assert cache.global_version() is None
+    cache.bump(5)
+    assert cache.global_version() == 5
+
+def test_shared_backend_between_processes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'cache.db'}"
+    a = CatalogCache(backend=cache_backend.make_backend(url))
+    b = CatalogCache(backend=cache_backend.make_backend(url))
+    a.set('k', [1, 2], a.epoch) # versi global belum diketahui: hanya lokal
+    assert b.get('k') == (False, None)
+    a.bump(7); b.bump(7)
+    a.set('k', [1, 2], a.epoch)
+    assert b.get('k') == (True, [1, 2]) and b.stats()['shared_hits'] == 1
+    b.bump(8)
+    assert b.get('k') == (False, None)
+
+def test_backend_outage_falls_back_to_local_cache(down_backend):
+    cache = CatalogCache(backend=down_backend)
+    cache.bump(1)
+    cache.set('k', 1, cache.epoch)
+    assert cache.get('k') == (True, 1)
+    assert cache.get('lain') == (False, None)
@@ -0,0 +1,39 @@
+# tests/test_catalog.py
+import pandas as pd
+
+def test_whitespace_variants_count_once_and_score_full(db):
+    df = pd.DataFrame([("Tumis Bawang", None, "Bawang  Merah", 3, "siung"), ("Tumis Bawang", None, "bawang merah", 2, "siung"),
+                       ("Tumis Bawang", None, "Minyak\tGoreng", 1, "sdm")], columns=db.BULK_COLUMNS)
+    db.bulk_import_recipes(df)
+    recipes = db.get_all_recipes()
+    row = recipes[recipes['name'] == "Tumis Bawang"].iloc[0]
+    assert row['ingredient_count'] == 2
+    catalog = set(db.get_ingredient_catalog()['ingredient_key'])
+    assert {'bawang merah', 'minyak goreng'} <= catalog
+    match = next(r for r in db.find_matching_recipes(["bawang merah", "minyak goreng"]) if r['id'] == row['id'])
+    assert match['match_score'] == 100 and match['missing_count'] == 0
+
+def test_grid_edit_stores_blank_values_as_null(db):
+    import numpy as np
+    db.bulk_import_recipes(pd.DataFrame([("Grid Kosong", None, "Garam", 1, "sdt")], columns=db.BULK_COLUMNS))
+    recipes = db.get_all_recipes()
+    rid = int(recipes.loc[recipes['name'] == "Grid Kosong", 'id'].iloc[0])
+    ings = db.get_ingredients_by_recipe(rid)
+    edited = pd.concat([ings, pd.DataFrame([{'id': np.nan, 'ingredient_name': "Merica", 'quantity': np.nan, 'unit': np.nan}])],
+                       ignore_index=True)
+    db.save_recipe_ingredients(rid, ings, edited)
+    row = db.run_query("SELECT quantity IS NULL AS q, unit IS NULL AS u FROM ingredients WHERE recipe_id=%s AND ingredient_name='Merica'",
+                       (rid,), fetch_data=True).iloc[0]
+    assert row['q'] and row['u']
+
+def test_migration_11_rekeys_prices(db):
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        c.execute("""INSERT INTO ingredient_prices (ingredient_key, display_name, pack_size, pack_unit, pack_price, updated_at) VALUES
+                     ('daun  salam', 'Daun  Salam', 10, 'lembar', 2000, now() - interval '1 day'),
+                     ('daun salam', 'Daun Salam', 20, 'lembar', 3000, now()),
+                     ('kayu \t manis', 'Kayu Manis', 50, 'gram', 8000, now())""")
+        for stmt in dict((v, s) for v, _, s in db.MIGRATIONS)[11]: c.execute(stmt) if isinstance(stmt, str) else stmt(c)
+        c.execute("SELECT ingredient_key, pack_price FROM ingredient_prices WHERE display_name IN ('Daun  Salam', 'Daun Salam', 'Kayu Manis')")
+        assert sorted(c.fetchall()) == [('daun salam', 3000), ('kayu manis', 8000)]
+        conn.rollback()
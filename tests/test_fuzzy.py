@@ -0,0 +1,42 @@
+# tests/test_fuzzy.py
+import fuzzy
+
+NAMES = ["bawang merah", "bawang putih", "bawang bombay", "cabai merah", "gula pasir", "garam"]
+
+def _index():
+    return fuzzy.TrigramIndex(NAMES + ["garam"], {"garam": 50, "bawang merah": 30, "gula pasir": 10})
+
+def test_canonical_collapses_case_and_whitespace():
+    assert fuzzy.canonical("  Bawang \t Merah\n") == "bawang merah"
+    assert fuzzy.canonical(12) == "12"
+
+def test_duplicate_names_are_indexed_once():
+    idx = _index()
+    assert idx.names.count("garam") == 1 and len(idx.names) == len(NAMES)
+
+def test_empty_query_returns_most_used():
+    assert _index().suggest("", 2) == ["garam", "bawang merah"]
+
+def test_prefix_matches_come_first():
+    assert _index().suggest("baw", 3) == ["bawang bombay", "bawang merah", "bawang putih"] # query pendek: urut abjad
+    assert _index().suggest("Bawang  P", 1) == ["bawang putih"]
+
+def test_resolve_tolerates_typos_and_whitespace_variants():
+    idx = _index()
+    assert idx.resolve("Bawang  Merah ") == "bawang merah"
+    assert idx.resolve("bawnag merah") == "bawang merah"
+    assert idx.resolve("kecap manis") == "kecap manis" # tidak dikenal: kanoniknya sendiri
+
+def test_unrelated_query_has_no_suggestions():
+    assert _index().scored("xyzq", 5) == []
+
+def test_resolve_on_large_index_scores_full_overlap():
+    # 100k nama: trigram 'bawang'/'merah' sangat umum, sedangkan ' bw'/'bwa' jarang (hanya di 'bway')
+    names = [f"bawang {i}" for i in range(50000)] + [f"merah {i}" for i in range(49000)] + \
+            [f"garam bway {i}" for i in range(1000)] + ["bawang merah", "bawang putih"]
+    idx = fuzzy.TrigramIndex(names)
+    assert idx.resolve("bwang merah") == "bawang merah"
+    assert idx.resolve("bawnag putih") == "bawang putih"
+    sim, name = idx.scored("bwang merah", 1, prefix_first=False)[0]
+    q, n = fuzzy.trigrams("bwang merah"), fuzzy.trigrams(name)
+    assert name == "bawang merah" and sim == len(q & n) / len(q | n)
@@ -0,0 +1,27 @@
+# tests/test_pagination.py
+import os
+
+def _picker_script():
+    import os, sys
+    import pandas as pd
+    import streamlit as st
+    sys.path.insert(0, os.environ['APP_ROOT'])
+    from app import paged_picker
+    rows = st.session_state.setdefault('rows', [1, 2, 3, 4, 5])
+    def fetch(term, cursor):
+        page = [r for r in rows if cursor is None or r > cursor][:3]
+        df = pd.DataFrame({'id': page[:2], 'name': [f"Resep {r}" for r in page[:2]]})
+        return df, (page[1] if len(page) > 2 else None)
+    picked = paged_picker("Resep", fetch, 'id', 'name', key='p')
+    st.session_state['picked'] = None if picked is None else int(picked[0])
+
+def test_empty_page_steps_back(db, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    monkeypatch.setenv('APP_ROOT', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    at = AppTest.from_function(_picker_script, default_timeout=30).run()
+    at.button(key='p_next').click().run()
+    at.button(key='p_next').click().run()
+    assert at.session_state['picked'] == 5
+    at.session_state['rows'] = [1, 2, 3, 4] # baris satu-satunya di halaman 3 dihapus
+    at.run()
+    assert at.session_state['picked'] == 3 and at.button(key='p_prev')
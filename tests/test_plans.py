@@ -0,0 +1,63 @@
+# tests/test_plans.py
+import pandas as pd
+
+def _recipe(db, name, rows):
+    df = pd.DataFrame([(name, None, n, q, u) for n, q, u in rows], columns=db.BULK_COLUMNS)
+    db.bulk_import_recipes(df)
+    recipes = db.get_all_recipes()
+    return int(recipes.loc[recipes['name'] == name, 'id'].iloc[0])
+
+def _totals(db, plan_id):
+    return {(r.ingredient_name.lower(), r.unit): r.total_quantity for r in db.get_plan_totals(plan_id).itertuples()}
+
+def test_plan_item_with_unitless_ingredient(db):
+    rid = _recipe(db, "Telur Ceplok", [("Telur", 2, "butir"), ("Garam", 1, None), ("Merica", 1, "")])
+    plan = db.create_plan('user', "tanpa satuan")
+    item = db.add_plan_item(plan, rid, 3)
+    assert _totals(db, plan) == {('telur', 'butir'): 6, ('garam', ''): 3, ('merica', ''): 3}
+    db.remove_plan_item(item)
+    assert db.get_plan_totals(plan).empty
+
+def test_plan_totals_group_by_canonical_name(db):
+    a = _recipe(db, "Sambal A", [("Bawang Merah", 3, "siung"), ("Cabai", 100, "gram")])
+    b = _recipe(db, "Sambal B", [("bawang merah ", 2, "Siung"), ("cabai", 0.5, "kg")])
+    plan = db.create_plan('user', "kanonik")
+    db.add_plan_item(plan, a, 1)
+    db.add_plan_item(plan, b, 1)
+    assert _totals(db, plan) == {('bawang merah', 'siung'): 5, ('cabai', 'gram'): 600}
+    shopping = db.get_shopping_list([(a, 1), (b, 1)])
+    assert len(shopping) == 2 and sorted(shopping['total_quantity']) == [5, 600]
+
+def test_ingredient_edit_refreshes_plan_with_unitless_rows(db):
+    rid = _recipe(db, "Teh Manis", [("Gula", 1, "sdm"), ("Teh", 1, None)])
+    plan = db.create_plan('user', "refresh")
+    db.add_plan_item(plan, rid, 2)
+    ings = db.get_ingredients_by_recipe(rid)
+    edited = pd.concat([ings, pd.DataFrame([{'ingredient_name': "Es Batu", 'quantity': 3, 'unit': None}])], ignore_index=True)
+    assert db.save_recipe_ingredients(rid, ings, edited) == {'inserted': 1, 'updated': 0, 'deleted': 0}
+    assert _totals(db, plan) == {('gula', 'ml'): 30, ('teh', ''): 2, ('es batu', ''): 6}
+
+def test_density_converts_volume_when_same_ingredient_is_weighed(db):
+    a = _recipe(db, "Ayam Kecap", [("Kecap Manis", 100, "gram"), ("Minyak Goreng", 2, "sdm")])
+    b = _recipe(db, "Tahu Kecap", [("kecap manis", 2, "sdm")])
+    shopping = db.get_shopping_list([(a, 1), (b, 1)])
+    got = {(r.ingredient_name.lower(), r.unit): round(r.total_quantity, 6) for r in shopping.itertuples()}
+    assert got == {('kecap manis', 'gram'): 139, ('minyak goreng', 'ml'): 30}
+    breakdown = db.get_shopping_breakdown(((a, 1), (b, 1)))
+    assert set(breakdown['unit']) == {'gram', 'ml'} and round(breakdown['total_quantity'].sum(), 6) == 169
+    plan = db.create_plan('user', "massa jenis")
+    db.add_plan_item(plan, a, 1)
+    assert _totals(db, plan) == {('kecap manis', 'gram'): 100, ('minyak goreng', 'ml'): 30}
+    db.add_plan_item(plan, b, 1)
+    assert {k: round(v, 6) for k, v in _totals(db, plan).items()} == got
+    assert set(db.get_plans_totals([plan])['plan_id']) == {plan}
+
+def test_plan_write_errors_return_none(db, monkeypatch):
+    plan = db.create_plan('user', "gagal")
+    assert db.add_plan_item(plan, 10 ** 9, 1) is None # resep tidak ada: pelanggaran foreign key
+    assert db.get_plan_items(plan).empty
+    assert db.remove_plan_item(10 ** 9) is True and db.clear_plan(plan) is True
+    def full(timeout=None): raise db.pg_pool.PoolError("pool penuh")
+    monkeypatch.setattr(db.get_pool(), 'getconn', full)
+    assert db.create_plan('user', "x") is None
+    assert db.remove_plan_item(1) is None and db.clear_plan(plan) is None
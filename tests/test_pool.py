@@ -0,0 +1,21 @@
+# tests/test_pool.py
+import os
+
+import psycopg2
+
+def test_getconn_skips_every_dead_idle_connection(db):
+    pool = db.ConnectionPool(os.environ['DATABASE_URL'], minconn=3, maxconn=3, timeout=1)
+    conns = [pool.getconn() for _ in range(3)]
+    pids = [c.get_backend_pid() for c in conns]
+    for c in conns: pool.putconn(c)
+    # Simulasi restart Postgres: semua koneksi idle di pool diputus
+    admin = psycopg2.connect(os.environ['DATABASE_URL'])
+    with admin.cursor() as c: c.execute("SELECT pg_terminate_backend(pid) FROM unnest(%s::int[]) AS pid", (pids,))
+    admin.close()
+    conn = pool.getconn()
+    with conn.cursor() as c:
+        c.execute("SELECT 1")
+        assert c.fetchone() == (1,)
+    assert conn.get_backend_pid() not in pids and pool.stats()['reconnects'] == 3
+    pool.putconn(conn)
+    pool._pool.closeall()
@@ -0,0 +1,28 @@
+# tests/test_profiling.py
+import os
+from types import SimpleNamespace
+
+import profiling
+
+def _st(monkeypatch, params, state):
+    monkeypatch.setattr(profiling, 'st', SimpleNamespace(query_params=params, session_state=state))
+
+def test_query_param_only_enables_profiling_for_admin(monkeypatch):
+    monkeypatch.setattr(profiling, 'get_setting', lambda name, default=None: default)
+    _st(monkeypatch, {'profile': '1'}, {})
+    assert not profiling.enabled()
+    _st(monkeypatch, {'profile': '1'}, {'logged_in': True, 'role': 'user'})
+    assert not profiling.enabled()
+    _st(monkeypatch, {'profile': '1'}, {'logged_in': True, 'role': 'admin'})
+    assert profiling.enabled()
+    monkeypatch.setattr(profiling, 'get_setting', lambda name, default=None: '1' if name == 'PROFILE' else default)
+    _st(monkeypatch, {}, {})
+    assert profiling.enabled()
+
+def test_prune_keeps_latest_profiles(tmp_path):
+    for ts in range(1000, 1000 + profiling.HISTORY + 5):
+        (tmp_path / f"rerun_{ts}.prof").write_bytes(b'')
+    (tmp_path / "lain.txt").write_text('x')
+    profiling._prune(str(tmp_path))
+    kept = sorted(os.listdir(tmp_path))
+    assert len(kept) == profiling.HISTORY + 1 and kept[0] == "lain.txt" and kept[1] == "rerun_1005.prof"
@@ -0,0 +1,50 @@
+# tests/test_replica.py
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+def test_exhausted_replica_pool_falls_back_without_marking_down(db):
+    router = db.ReplicaRouter(os.environ['DATABASE_URL'], minconn=1, maxconn=1, timeout=30)
+    pool, conn = router.acquire()
+    start = time.monotonic()
+    assert router.acquire() is None
+    assert time.monotonic() - start < 1 # langsung ke primary, tidak menunggu slot replika
+    assert router.stats() == {'reads': 1, 'fallbacks': 1, 'up': True}
+    pool.putconn(conn)
+    assert router.acquire() is not None
+
+def test_unreachable_replica_is_marked_down(db):
+    router = db.ReplicaRouter("postgresql://localhost:1/none?connect_timeout=1", retry=60)
+    assert router.acquire() is None
+    assert router.stats()['up'] is False
+
+def test_async_reads_share_replica_down_state(db, monkeypatch):
+    adb = pytest.importorskip('database_async')
+    if adb.AsyncConnectionPool is None: pytest.skip("butuh psycopg 3")
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    run = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+    async def open_pool(dsn):
+        pool = adb.AsyncConnectionPool(dsn, min_size=1, max_size=2, timeout=0.5, open=False)
+        await pool.open()
+        return pool
+    dead = "postgresql://localhost:1/none?connect_timeout=1"
+    rt = SimpleNamespace(loop=loop, pool=run(open_pool(os.environ['DATABASE_URL'])), replica=run(open_pool(dead)))
+    router = db.ReplicaRouter(dead, retry=60)
+    monkeypatch.setattr(adb, 'get_runtime', lambda: rt)
+    monkeypatch.setattr(db, 'get_replica', lambda: router)
+    monkeypatch.setattr(db, 'recently_wrote', lambda: False)
+    async def one(): return (await adb.run_query("SELECT 1 AS x", fetch_data=True))['x'].tolist()
+    try:
+        assert adb.fetch_all(x=(one,)) == {'x': [1]}
+        assert router.stats()['up'] is False
+        start = time.monotonic()
+        assert adb.fetch_all(x=(one,)) == {'x': [1]}
+        assert time.monotonic() - start < 0.5 # replika yang down tidak dicoba lagi
+    finally:
+        run(rt.pool.close()); run(rt.replica.close())
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,57 @@
+# tests/test_security.py
+import pytest
+
+import cache_backend
+import security
+
+@pytest.fixture
+def backend(monkeypatch):
+    b = cache_backend.MemoryBackend()
+    monkeypatch.setattr(cache_backend, 'get_backend', lambda: b)
+    monkeypatch.setenv('SESSION_SECRET', 'rahasia-uji')
+    return b
+
+def test_token_roundtrip_and_tampering(backend):
+    token = security.issue_token('budi', 'admin')
+    assert security.verify_token(token) == ('budi', 'admin')
+    payload, sig = token.split('.')
+    other = security.issue_token('budi', 'user').split('.')[0]
+    assert security.verify_token(f"{other}.{sig}") is None
+    assert security.verify_token("bukan-token") is None
+    assert security.verify_token(f"{payload}.{sig}x") is None
+
+def test_expired_token_is_rejected(backend):
+    assert security.verify_token(security.issue_token('budi', 'user', ttl=-1)) is None
+
+def test_revoked_token_is_rejected(backend):
+    token = security.issue_token('budi', 'user')
+    assert security.revoke_token(token)
+    assert security.verify_token(token) is None
+    assert security.verify_token(security.issue_token('budi', 'user')) == ('budi', 'user')
+
+def test_backend_outage_does_not_break_login_or_logout(backend, down_backend, monkeypatch):
+    token = security.issue_token('budi', 'user')
+    monkeypatch.setattr(cache_backend, 'get_backend', lambda: down_backend)
+    assert security.verify_token(token) == ('budi', 'user')
+    assert security.revoke_token(token) is False
+
+def test_shared_backend_requires_session_secret(down_backend, monkeypatch):
+    monkeypatch.delenv('SESSION_SECRET', raising=False)
+    monkeypatch.setattr(security, 'get_setting', lambda name, default=None: default)
+    monkeypatch.setattr(cache_backend, 'get_backend', lambda: cache_backend.MemoryBackend())
+    assert security.verify_token(security.issue_token('budi', 'user')) == ('budi', 'user')
+    monkeypatch.setattr(cache_backend, 'get_backend', lambda: down_backend)
+    with pytest.raises(RuntimeError, match="SESSION_SECRET"):
+        security.issue_token('budi', 'user')
+
+@pytest.mark.skipif(security.bcrypt is None, reason="butuh bcrypt")
+def test_bcrypt_accepts_passwords_over_72_bytes():
+    h = security.BcryptHasher(rounds=4)
+    long_pw = 'a' * 80
+    hashed = h.hash(long_pw)
+    assert h.verify(long_pw, hashed)
+    assert not h.verify('a' * 79, hashed)
+    short = h.hash('rahasia')
+    assert h.verify('rahasia', short)
+    assert security.verify_password(long_pw, short) == (False, False)
+    assert security.verify_password('rahasia', '$2b$12$rusak') == (False, False)
@@ -0,0 +1,26 @@
+# tests/test_session.py
+import os
+import security
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+def _open_with_token(token):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.query_params['token'] = token
+    return at.run()
+
+def test_token_of_deleted_user_is_rejected(db):
+    db.create_user('sesi_hapus', 'rahasia', 'user')
+    token = security.issue_token('sesi_hapus', 'user')
+    assert _open_with_token(token).session_state['logged_in']
+    db.delete_user_data('sesi_hapus')
+    at = _open_with_token(token)
+    assert not at.session_state['logged_in'] and 'token' not in at.query_params
+
+def test_token_role_follows_database(db):
+    db.create_user('sesi_turun', 'rahasia', 'admin')
+    token = security.issue_token('sesi_turun', 'admin')
+    db.update_user('sesi_turun', None, 'user')
+    at = _open_with_token(token)
+    assert at.session_state['logged_in'] and at.session_state['role'] == 'user'
@@ -0,0 +1,64 @@
+# tests/test_snapshot.py
+import os
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import snapshot
+
+RECIPES = ['id', 'name', 'source_link', 'ingredient_count']
+INGREDIENTS = ['id', 'recipe_id', 'ingredient_name', 'ingredient_key', 'quantity', 'unit']
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setenv('SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(snapshot, '_loaded', {})
+    return tmp_path
+
+def _fetch(chunks):
+    return lambda query: iter(chunks['recipes' if 'FROM recipes' in query else 'ingredients'])
+
+def test_chunk_with_all_null_column_does_not_fix_the_type(folder):
+    chunks = {
+        # potongan pertama: source_link & unit seluruhnya NULL (mis. hasil import tanpa kolom itu)
+        'recipes': [pd.DataFrame([(1, "Soto", None, 1)], columns=RECIPES),
+                    pd.DataFrame([(2, "Rawon", "https://contoh", 1)], columns=RECIPES)],
+        'ingredients': [pd.DataFrame([(1, 1, "Ayam", "ayam", None, None)], columns=INGREDIENTS),
+                        pd.DataFrame([(2, 2, "Daging", "daging", 250.0, "gram")], columns=INGREDIENTS),
+                        pd.DataFrame([], columns=INGREDIENTS)],
+    }
+    tables = snapshot.build(1, _fetch(chunks))
+    assert tables['recipes']['source_link'].to_pylist() == [None, "https://contoh"]
+    assert tables['ingredients']['quantity'].to_pylist() == [None, 250.0]
+    assert snapshot.stats(tables)['unique_ingredients'] == 2
+
+def test_failed_build_leaves_no_temporary_file(folder):
+    chunks = {'recipes': [pd.DataFrame([(1, "Soto", None, 1)], columns=RECIPES),
+                          pd.DataFrame([("x", "Rawon", None, 1)], columns=RECIPES)], 'ingredients': []}
+    with pytest.raises(pa.ArrowException):
+        snapshot.build(2, _fetch(chunks))
+    assert os.listdir(folder) == []
+    assert snapshot.load(2) is None
+
+def test_snapshot_from_database_with_coalesced_rebuilds(db, folder, monkeypatch):
+    import time
+    for name, value in [('CATALOG_SNAPSHOT', '1'), ('SNAPSHOT_CHUNK_ROWS', '2'), ('SNAPSHOT_DELAY', '0.2')]:
+        monkeypatch.setenv(name, value)
+    db.bulk_import_recipes(pd.DataFrame([("Snapshot A", None, "Gula", 1, "sdm"), ("Snapshot A", None, "Air", 200, "ml"),
+                                         ("Snapshot B", None, "Garam", None, None)], columns=db.BULK_COLUMNS))
+    builds = []
+    build = snapshot.build
+    monkeypatch.setattr(snapshot, 'build', lambda version, fetch: builds.append(version) or build(version, fetch))
+    for _ in range(3): db.catalog_changed()
+    assert db.get_snapshot() is None # belum siap: pembaca memakai database, tidak membangun sendiri
+    assert db.get_catalog_stats()['source'] == 'database' and builds == []
+    deadline = time.monotonic() + 10
+    while not builds and time.monotonic() < deadline: time.sleep(0.05)
+    time.sleep(0.5)
+    assert builds == [db.get_cache().global_version()]
+    tables = db.get_snapshot()
+    assert tables['recipes'].num_rows == len(db.get_all_recipes())
+    stats = db.get_catalog_stats()
+    assert stats['source'] == 'snapshot' and stats['ingredient_rows'] == tables['ingredients'].num_rows
+    assert any(r['name'] == "Snapshot B" for r in db.find_matching_recipes(["garam"]))
@@ -0,0 +1,79 @@
+# tests/test_utils.py
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+def test_generate_excel_writes_nan_quantity_as_blank():
+    df = pd.DataFrame({'ingredient_name': ["Garam", "Telur"], 'Estimasi': ["secukupnya", "2 butir"]})
+    breakdown = pd.DataFrame({'recipe_name': ["Telur Dadar"] * 2, 'ingredient_name': ["Garam", "Telur"],
+                              'total_quantity': [np.nan, 2.0], 'unit': [None, "butir"]})
+    data = utils.generate_excel(df, breakdown)
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        sheet = z.read('xl/worksheets/sheet2.xml').decode()
+    assert '#NUM!' not in sheet and '<v>2</v>' in sheet
+
+def test_read_recipe_file_drops_rows_without_recipe_name():
+    csv = BytesIO(b"recipe_name,ingredient_name,quantity,unit\n"
+                  b"Nasi Goreng,Nasi,200,gram\n,Telur,1,butir\n  ,Garam,secukupnya,\nSoto,Ayam,250,gram\n")
+    df = utils.read_recipe_file(csv, "resep.csv")
+    assert df['recipe_name'].tolist() == ["Nasi Goreng", "Soto"]
+    assert df['source_link'].isna().all() and list(df.columns) == utils.RECIPE_FILE_COLUMNS
+
+def _ingredients(rows):
+    return pd.DataFrame(rows, columns=['id', 'ingredient_name', 'quantity', 'unit'])
+
+def test_diff_ingredient_rows_nan_and_blank_values():
+    original = _ingredients([(1, "Garam", np.nan, None), (2, "Telur", 2.0, "butir"), (3, "Gula", 1.0, "sdm")])
+    edited = original.copy()
+    edited.loc[0, 'unit'] = np.nan          # None -> NaN dari data_editor bukan perubahan
+    edited.loc[1, 'quantity'] = 3           # update
+    edited.loc[2, 'ingredient_name'] = "  " # nama dikosongkan -> dihapus
+    edited = pd.concat([edited, _ingredients([(np.nan, "Merica", np.nan, np.nan), (np.nan, None, 1.0, "gram")])],
+                       ignore_index=True)
+    inserts, updates, deletes = utils.diff_ingredient_rows(original, edited)
+    assert inserts == [("Merica", None, None)]
+    assert updates == [("Telur", 3.0, "butir", 2)]
+    assert deletes == [3]
+
+def test_diff_ingredient_rows_unchanged_grid_is_empty():
+    original = _ingredients([(1, "Garam", np.nan, None), (2, "Bawang  Merah", 3.0, "siung")])
+    assert utils.diff_ingredient_rows(original, original.copy()) == ([], [], [])
+
+def test_ingredient_key_matches_fuzzy_canonical():
+    import fuzzy
+    names = pd.Series(["Bawang  Merah ", "\tminyak\nGoreng", "GULA"])
+    assert utils.ingredient_key(names).tolist() == [fuzzy.canonical(n) for n in names] == \
+        ["bawang merah", "minyak goreng", "gula"]
+
+PRICES = pd.DataFrame([("bawang merah", "Bawang Merah", 250, "gram", 10000), ("minyak goreng", "Minyak Goreng", 1, "liter", 20000),
+                       ("telur", "Telur", 10, "butir", 25000)], columns=utils.PRICE_COLUMNS)
+
+def test_pack_table_converts_base_units_and_densities():
+    packs = utils.pack_table(PRICES).set_index(['ingredient_key', 'unit'])
+    assert packs.loc[('minyak goreng', 'ml'), 'pack_qty'] == 1000
+    assert packs.loc[('minyak goreng', 'gram'), 'pack_qty'] == 920
+    assert ('bawang merah', 'ml') not in packs.index # massa jenis tidak diketahui
+    assert utils.pack_table(None).empty
+
+def test_compute_costs_edge_cases():
+    need = pd.DataFrame({'ingredient_name': ["Bawang  Merah", "Minyak Goreng", "Telur", "Garam", "telur"],
+                         'unit': ["gram", "gram", "butir", "", "butir"],
+                         'total_quantity': [500.0000001, 100, np.nan, 5, 0]}, index=[10, 11, 12, 13, 14])
+    out = utils.compute_costs(need, PRICES)
+    assert list(out.index) == [10, 11, 12, 13, 14]
+    assert out.loc[10, 'packs'] == 2 and out.loc[10, 'cost'] == 20000      # galat float tidak menambah kemasan
+    assert out.loc[11, 'packs'] == 1 and out.loc[11, 'leftover'] == 820    # gram lewat massa jenis
+    assert np.isnan(out.loc[12, 'cost'])                                   # jumlah kosong
+    assert np.isnan(out.loc[13, 'pack_price'])                             # tanpa harga / satuan kosong
+    assert out.loc[14, 'packs'] == 0 and out.loc[14, 'cost'] == 0
+
+def test_compare_menu_costs_scales_before_rounding():
+    totals = pd.DataFrame({'menu': ["A", "A", "B"], 'ingredient_name': ["Telur", "Garam", "Telur"],
+                           'unit': ["butir", "gram", "butir"], 'total_quantity': [6, 5, 12]})
+    res = utils.compare_menu_costs(totals, PRICES, scale=2).set_index('menu')
+    assert res.loc["A", 'total_cost'] == 50000 and res.loc["A", 'missing_prices'] == 1
+    assert res.loc["B", 'total_cost'] == 75000 and res.loc["B", 'priced_items'] == 1
@@ -1,22 +1,70 @@
 # utils.py
 import pandas as pd
-from io import BytesIO
+import numpy as np
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO, StringIO
+
+# --- REGISTRY SATUAN ---
+
+# Satuan kanonik -> (dimensi, faktor ke satuan dasar dimensinya)
+UNITS = {
+    'gram': ('mass', 1), 'mg': ('mass', 0.001), 'ons': ('mass', 100), 'kg': ('mass', 1000),
+    'ml': ('volume', 1), 'sdt': ('volume', 5), 'sdm': ('volume', 15), 'gelas': ('volume', 240),
+    'liter': ('volume', 1000),
+    'butir': ('count', 1), 'siung': ('count', 1), 'buah': ('count', 1), 'lembar': ('count', 1),
+    'batang': ('count', 1), 'ikat': ('count', 1), 'ruas': ('count', 1), 'pcs': ('count', 1),
+}
+BASE_UNITS = {'mass': 'gram', 'volume': 'ml'} # satuan 'count' tidak digabung antar jenis
+
+UNIT_ALIASES = {
+    'g': 'gram', 'gr': 'gram', 'grm': 'gram', 'miligram': 'mg', 'kilo': 'kg', 'kilogram': 'kg',
+    'l': 'liter', 'lt': 'liter', 'ltr': 'liter', 'mililiter': 'ml', 'cc': 'ml',
+    'sendok teh': 'sdt', 'sendok makan': 'sdm', 'cup': 'gelas', 'cangkir': 'gelas',
+    'btr': 'butir', 'bh': 'buah', 'lbr': 'lembar', 'btg': 'batang', 'biji': 'buah',
+}
+
+# Massa jenis (gram per ml) untuk konversi volume -> massa per bahan
+INGREDIENT_DENSITY = {
+    'air': 1.0, 'minyak goreng': 0.92, 'kecap manis': 1.3, 'kecap asin': 1.2, 'santan': 1.0,
+    'susu cair': 1.03, 'gula pasir': 0.85, 'tepung terigu': 0.53, 'madu': 1.42, 'garam': 1.2,
+}
+
+def _build_unit_rules():
+    rules = {}
+    for name in list(UNITS) + list(UNIT_ALIASES):
+        canon = UNIT_ALIASES.get(name, name)
+        dim, factor = UNITS[canon]
+        rules[name] = (BASE_UNITS.get(dim, canon), factor)
+    return rules
+
+# Ejaan satuan -> (satuan dasar, faktor). Dipakai juga oleh agregasi SQL di database.py
+UNIT_RULES = _build_unit_rules()
+_BASE_OF = {k: v[0] for k, v in UNIT_RULES.items()}
+_FACTOR_OF = {k: float(v[1]) for k, v in UNIT_RULES.items()}
 
 def normalize_units(df):
-    rules = {
-        'kg': ('gram', 1000), 'kilo': ('gram', 1000), 'liter': ('ml', 1000), 
-        'l': ('ml', 1000), 'ons': ('gram', 100)
-    }
-    def convert(row):
-        u = str(row['unit']).lower().strip()
-        q = row['total_quantity']
-        if u in rules:
-            new_u, factor = rules[u]
-            return pd.Series([q * factor, new_u])
-        return pd.Series([q, row['unit']])
+    """Konversi kolom unit/total_quantity ke satuan dasar secara vektor (tanpa apply per baris).
+
+    Baris volume diubah ke gram jika bahan yang sama juga muncul dalam satuan massa
+    dan massa jenisnya diketahui, agar bisa dijumlahkan.
+    """
+    if df.empty: return df
+    u = df['unit'].astype(str).str.lower().str.strip()
+    base = u.map(_BASE_OF)
+    df['total_quantity'] = df['total_quantity'] * u.map(_FACTOR_OF).fillna(1.0)
+    df['unit'] = base.where(base.notna(), df['unit'])
     
-    if not df.empty:
-        df[['total_quantity', 'unit']] = df.apply(convert, axis=1)
+    if 'ingredient_name' in df:
+        key = ingredient_key(df['ingredient_name'])
+        density = key.map(INGREDIENT_DENSITY)
+        mass_keys = key[df['unit'] == 'gram'].unique()
+        to_mass = (df['unit'] == 'ml') & density.notna() & key.isin(mass_keys)
+        if to_mass.any():
+            df.loc[to_mass, 'total_quantity'] = df.loc[to_mass, 'total_quantity'] * density[to_mass]
+            df.loc[to_mass, 'unit'] = 'gram'
     return df
 
 def format_indo(num):
@@ -24,29 +72,218 @@ def format_indo(num):
     if ',' in s: s = s.rstrip('0').rstrip(',')
     return s
 
+# Satuan dasar -> (satuan tampilan, faktor) saat nilainya >= faktor
+DISPLAY_UNITS = {'gram': ('kg', 1000), 'ml': ('liter', 1000)}
+
 def format_output(val, unit):
     final_val = val
     final_unit = unit
-    if unit == 'gram' and val >= 1000: final_val /= 1000; final_unit = 'kg'
-    elif unit == 'ml' and val >= 1000: final_val /= 1000; final_unit = 'liter'
+    if unit in DISPLAY_UNITS and val >= DISPLAY_UNITS[unit][1]:
+        final_unit, factor = DISPLAY_UNITS[unit]
+        final_val /= factor
     return f"{format_indo(final_val)} {final_unit}"
 
-def generate_excel(df):
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    
-    # PERBAIKAN DI SINI:
-    # Mengubah 'Estimasi Belanja' menjadi 'Estimasi' agar cocok dengan app.py
-    save_df = df[['ingredient_name', 'Estimasi']].rename(columns={'Estimasi': 'Harus Dibeli'})
+def format_output_series(vals, units):
+    """Versi vektor dari format_output untuk satu kolom penuh."""
+    factor = units.map({k: v[1] for k, v in DISPLAY_UNITS.items()})
+    big = factor.notna() & (vals >= factor)
+    shown_val = vals.where(~big, vals / factor)
+    shown_unit = units.where(~big, units.map({k: v[0] for k, v in DISPLAY_UNITS.items()}))
+    return pd.Series([f"{format_indo(v)} {u}" for v, u in zip(shown_val, shown_unit)], index=vals.index)
+
+# --- BIAYA BELANJA ---
+
+PRICE_COLUMNS = ['ingredient_key', 'display_name', 'pack_size', 'pack_unit', 'pack_price']
+
+def ingredient_key(names):
+    """Versi vektor dari kolom ingredients.ingredient_key (sama dengan fuzzy.canonical)."""
+    return names.astype(str).str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+def pack_table(prices):
+    """Kemasan per bahan dalam satuan dasar: kolom ingredient_key, unit, pack_qty, pack_price.
+
+    Kemasan ml juga didaftarkan dalam gram (dan sebaliknya) jika massa jenis bahannya diketahui.
+    """
+    if prices is None or prices.empty:
+        return pd.DataFrame({'ingredient_key': [], 'unit': [], 'pack_qty': [], 'pack_price': []})
+    u = prices['pack_unit'].astype(str).str.lower().str.strip()
+    base = u.map(_BASE_OF)
+    packs = pd.DataFrame({'ingredient_key': prices['ingredient_key'], 'unit': base.where(base.notna(), u),
+                          'pack_qty': prices['pack_size'].astype(float) * u.map(_FACTOR_OF).fillna(1.0),
+                          'pack_price': prices['pack_price'].astype(float)})
+    density = packs['ingredient_key'].map(INGREDIENT_DENSITY)
+    ml = packs[(packs['unit'] == 'ml') & density.notna()]
+    gram = packs[(packs['unit'] == 'gram') & density.notna()]
+    alt = [ml.assign(unit='gram', pack_qty=ml['pack_qty'] * density[ml.index]),
+           gram.assign(unit='ml', pack_qty=gram['pack_qty'] / density[gram.index])]
+    return pd.concat([packs] + alt, ignore_index=True).drop_duplicates(['ingredient_key', 'unit'])
+
+def compute_costs(need, prices, qty_col='total_quantity'):
+    """Jumlah kemasan yang harus dibeli (dibulatkan ke atas) dan biayanya untuk setiap baris `need`.
+
+    `need` berisi ingredient_name (atau ingredient_key), unit dan `qty_col` dalam satuan dasar.
+    Return DataFrame ber-index sama dengan kolom pack_qty, pack_price, packs, cost, leftover;
+    NaN untuk bahan yang belum punya harga.
+    """
+    key = need['ingredient_key'] if 'ingredient_key' in need else ingredient_key(need['ingredient_name'])
+    unit = need['unit'].astype(str).str.lower().str.strip()
+    m = pd.DataFrame({'ingredient_key': key.to_numpy(), 'unit': unit.to_numpy()}).merge(
+        pack_table(prices), on=['ingredient_key', 'unit'], how='left')
+    qty = need[qty_col].to_numpy(dtype=float)
+    pack_qty = m['pack_qty'].to_numpy(dtype=float)
+    # Dibulatkan dulu agar galat float (mis. 2.0000001 kemasan) tidak menambah satu kemasan
+    packs = np.ceil(np.round(qty / pack_qty, 6)).clip(min=0)
+    out = pd.DataFrame({'pack_qty': pack_qty, 'pack_price': m['pack_price'].to_numpy(dtype=float), 'packs': packs},
+                       index=need.index)
+    out['cost'] = out['packs'] * out['pack_price']
+    out['leftover'] = out['packs'] * out['pack_qty'] - qty
+    return out
+
+def compare_menu_costs(totals, prices, scale=1.0):
+    """Biaya banyak menu sekaligus. `totals` berisi kolom menu, ingredient_name, unit, total_quantity.
+
+    Kebutuhan dikali `scale` sebelum dibulatkan ke kemasan. Return satu baris per menu:
+    menu, total_cost, priced_items, missing_prices.
+    """
+    need = totals.assign(total_quantity=totals['total_quantity'] * scale)
+    g = compute_costs(need, prices)['cost'].groupby(need['menu'])
+    res = pd.DataFrame({'total_cost': g.sum(), 'priced_items': g.count(), 'missing_prices': g.size() - g.count()})
+    return res.reset_index().rename(columns={'index': 'menu'})
+
+def format_rupiah(val): return f"Rp {format_indo(round(val))}"
+
+def format_rupiah_series(vals):
+    return pd.Series([format_rupiah(v) if pd.notna(v) else '-' for v in vals], index=vals.index)
+
+def format_packs_series(costs, units):
+    """Label pembelian per baris, mis. '3 × 1 kg'; '-' jika bahan belum punya harga."""
+    return pd.Series([f"{p:.0f} × {format_output(q, u)}" if pd.notna(p) else '-'
+                      for p, q, u in zip(costs['packs'], costs['pack_qty'], units)], index=costs.index)
+
+# --- DIFF TABEL BAHAN ---
+
+def _cells(frame, cols):
+    """Baris nilai `cols` sebagai objek Python; NaN/None menjadi None (NULL di DB, sel kosong di xlsx)."""
+    return zip(*[frame[c].astype(object).where(frame[c].notna(), None) for c in cols])
+
+def diff_ingredient_rows(original, edited, cols=('ingredient_name', 'quantity', 'unit')):
+    """Bandingkan tabel bahan sebelum/sesudah diedit (kolom `id` kosong = baris baru).
+
+    Return (inserts, updates, deletes): list tuple nilai `cols`, list (nilai `cols`..., id), list id.
+    Nilai kosong (NaN) dikembalikan sebagai None agar tersimpan sebagai NULL, bukan NaN.
+    """
+    cols = list(cols)
+    edited = edited.dropna(subset=['ingredient_name'])
+    edited = edited[edited['ingredient_name'].astype(str).str.strip() != '']
+    is_new = edited['id'].isna()
+    inserts = list(_cells(edited[is_new], cols))
     
-    save_df.to_excel(writer, index=False, sheet_name='Belanja')
+    kept = edited[~is_new].astype({'id': 'int64'}).set_index('id')[cols]
+    orig = original.set_index('id')[cols]
+    deletes = [int(i) for i in orig.index.difference(kept.index)]
+    both = kept.index.intersection(orig.index)
+    a, b = kept.loc[both], orig.loc[both]
+    changed = ((a != b) & ~(a.isna() & b.isna())).any(axis=1)
+    updates = [row + (int(i),) for i, row in zip(a.index[changed], _cells(a[changed], cols))]
+    return inserts, updates, deletes
+
+# --- IMPORT ---
+
+RECIPE_FILE_COLUMNS = ['recipe_name', 'source_link', 'ingredient_name', 'quantity', 'unit']
+
+def read_recipe_file(file, filename):
+    """Baca file import resep (CSV/JSON/Parquet) ke DataFrame format panjang RECIPE_FILE_COLUMNS.
+
+    JSON boleh berupa daftar baris datar, atau daftar resep
+    {"name", "source_link", "ingredients": [{"ingredient_name", "quantity", "unit"}]}.
+    """
+    ext = filename.rsplit('.', 1)[-1].lower()
+    if ext == 'csv':
+        df = pd.read_csv(file)
+    elif ext == 'json':
+        data = json.load(file)
+        if data and isinstance(data, list) and 'ingredients' in data[0]:
+            df = pd.json_normalize(data, 'ingredients', ['name', 'source_link'], errors='ignore')
+        else:
+            df = pd.DataFrame(data)
+    elif ext == 'parquet':
+        df = pd.read_parquet(file) # butuh pyarrow
+    else:
+        raise ValueError(f"Format file .{ext} tidak didukung (pakai CSV, JSON, atau Parquet)")
     
-    wb = writer.book; ws = writer.sheets['Belanja']
+    df = df.rename(columns={'name': 'recipe_name'})
+    if 'source_link' not in df: df['source_link'] = None
+    missing = [c for c in RECIPE_FILE_COLUMNS if c not in df]
+    if missing: raise ValueError(f"Kolom wajib tidak ada: {', '.join(missing)}")
+    # Baris tanpa nama resep dibuang (bukan diimport sebagai resep "nan")
+    df = df[RECIPE_FILE_COLUMNS].dropna(subset=['recipe_name']).copy()
+    df['recipe_name'] = df['recipe_name'].astype(str).str.strip()
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce')
+    return df[df['recipe_name'] != '']
+
+# --- EXPORT ---
+
+def generate_excel(df, breakdown=None):
+    """Workbook daftar belanja, ditulis baris per baris dengan mode constant_memory xlsxwriter.
+
+    Jika `breakdown` (recipe_name, ingredient_name, total_quantity, unit) diberikan,
+    ditambahkan sheet rincian per resep. Nilai kosong (NaN, mis. jumlah "secukupnya") ditulis
+    sebagai sel kosong, seperti pd.ExcelWriter sebelumnya.
+    """
+    import xlsxwriter
+    output = BytesIO()
+    wb = xlsxwriter.Workbook(output, {'constant_memory': True, 'nan_inf_to_errors': True})
     fmt_Head = wb.add_format({'bold': True, 'fg_color': '#4CAF50', 'font_color': 'white', 'border': 1})
     fmt_Body = wb.add_format({'border': 1})
     
-    for c, val in enumerate(save_df.columns): ws.write(0, c, val, fmt_Head)
+    ws = wb.add_worksheet('Belanja')
     ws.set_column('A:A', 30, fmt_Body); ws.set_column('B:B', 20, fmt_Body)
+    for c, val in enumerate(['ingredient_name', 'Harus Dibeli']): ws.write(0, c, val, fmt_Head)
+    for r, row in enumerate(_cells(df, ['ingredient_name', 'Estimasi']), start=1):
+        ws.write_row(r, 0, row)
     
-    writer.close()
+    if breakdown is not None:
+        ws = wb.add_worksheet('Per Resep')
+        ws.set_column('A:B', 30, fmt_Body); ws.set_column('C:D', 15, fmt_Body)
+        for c, val in enumerate(['Resep', 'Bahan', 'Jumlah', 'Satuan']): ws.write(0, c, val, fmt_Head)
+        rows = _cells(breakdown, ['recipe_name', 'ingredient_name', 'total_quantity', 'unit'])
+        for r, row in enumerate(rows, start=1):
+            ws.write_row(r, 0, row)
+    
+    wb.close()
     return output.getvalue()
+
+def iter_csv(df, chunk_size=10000):
+    """Generator CSV per potongan baris, agar daftar besar tidak dirender sekaligus."""
+    save_df = df[['ingredient_name', 'Estimasi']].rename(columns={'Estimasi': 'Harus Dibeli'})
+    for start in range(0, max(len(save_df), 1), chunk_size):
+        buf = StringIO()
+        save_df.iloc[start:start + chunk_size].to_csv(buf, index=False, header=start == 0)
+        yield buf.getvalue().encode('utf-8')
+
+def generate_csv(df): return b''.join(iter_csv(df))
+
+def frame_digest(*dfs):
+    h = hashlib.sha1()
+    for df in dfs:
+        if df is None: continue
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        h.update('|'.join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+_EXPORT_CACHE = OrderedDict()
+_EXPORT_LOCK = threading.Lock()
+EXPORT_CACHE_SIZE = 16
+
+def export_shopping_list(df, fmt='xlsx', breakdown=None):
+    """Bytes file export, di-cache berdasarkan hash isi daftar agar rerun identik tidak membangun ulang."""
+    key = (fmt, frame_digest(df, breakdown))
+    with _EXPORT_LOCK:
+        if key in _EXPORT_CACHE:
+            _EXPORT_CACHE.move_to_end(key)
+            return _EXPORT_CACHE[key]
+    data = generate_excel(df, breakdown) if fmt == 'xlsx' else generate_csv(df)
+    with _EXPORT_LOCK:
+        _EXPORT_CACHE[key] = data
+        while len(_EXPORT_CACHE) > EXPORT_CACHE_SIZE: _EXPORT_CACHE.popitem(last=False)
+    return data